@@ -0,0 +1 @@
+"""Benchmarks of the analysis routines."""
@@ -0,0 +1,69 @@
+"""Compare the exhaustive and adaptive searches of the equilibration time."""
+import argparse
+import time
+
+import numpy as np
+from pymbar import testsystems
+
+from reproducibility_project.src.analysis.equlibration import is_equilibrated
+
+
+def _time_call(func, *args, **kwargs):
+    """Return the result and wall time in seconds of a function call."""
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main():
+    """Print wall time against N for the exhaustive and adaptive searches."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[1000, 4000, 16000, 64000, 256000],
+        help="Lengths of the timeseries to benchmark.",
+    )
+    parser.add_argument(
+        "--tau", type=float, default=50.0, help="Correlation time."
+    )
+    parser.add_argument(
+        "--max-pymbar",
+        type=int,
+        default=4000,
+        help="Largest N for the (quadratic) exhaustive pymbar search.",
+    )
+    args = parser.parse_args()
+
+    header = (
+        f"{'N':>8} {'method':>7} {'exhaustive (s)':>15} {'adaptive (s)':>13}"
+        f" {'t0 exh.':>8} {'t0 adapt.':>9}"
+    )
+    print(header)
+    for N in args.sizes:
+        a_t = testsystems.correlated_timeseries_example(
+            N=N, tau=args.tau, seed=432
+        )
+        # Add an initial relaxation so there is something to detect.
+        n_relax = N // 10
+        a_t[:n_relax] += np.linspace(3, 0, n_relax)
+        for method in ["pymbar", "cumsum"]:
+            (_, t0_a, _), t_adapt = _time_call(
+                is_equilibrated, a_t, method=method, search="adaptive"
+            )
+            if method == "pymbar" and N > args.max_pymbar:
+                t0_e, t_exh = "-", "-"
+            else:
+                (_, t0_e, _), t_exh = _time_call(
+                    is_equilibrated, a_t, method=method, search="exhaustive"
+                )
+                t_exh = f"{t_exh:.3f}"
+            print(
+                f"{N:>8} {method:>7} {t_exh:>15} {t_adapt:>13.3f}"
+                f" {t0_e:>8} {t0_a:>9}"
+            )
+
+
+if __name__ == "__main__":
+    main()
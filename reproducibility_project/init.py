@@ -1,6 +1,7 @@
 """Initialize signac statepoints."""
 import itertools
 import os
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 import signac
@@ -123,110 +124,127 @@ ensembles = {
 }
 
 
-pr_root = os.path.join(os.getcwd(), "src")
-pr = signac.get_project(pr_root)
-
-# ignore statepoints that are not being tested (gemc only for methane, pentane)
-# filter the list of dictionaries
-total_statepoints = list()
-for molecule in molecules:
-    for (
-        engine,
-        ensemble,
-        (temp, press),
-        n_liq,
-        liq_box_L,
-        n_vap,
-        vap_box_L,
-        (init_liq_den, init_vap_den),
-        mass,
-        cutoff_style,
-        replica,
-    ) in itertools.product(
-        simulation_engines,
-        ensembles[molecule],
-        zip(temperatures[molecule], pressures[molecule]),
-        N_liq_molecules[molecule],
-        liq_box_lengths[molecule],
-        N_vap_molecules[molecule],
-        vap_box_lengths[molecule],
-        zip(init_density_liq[molecule], init_density_vap[molecule]),
-        masses[molecule],
-        cutoff_styles,
-        replicas,
-    ):
-        statepoint = {
-            "molecule": molecule,
-            "engine": engine,
-            "replica": replica,
-            "temperature": np.round(
-                temp.to_value("K"),
-                decimals=3,
-            ).item(),
-            "pressure": np.round(press.to_value("kPa"), decimals=3).item(),
-            "ensemble": ensemble if ensemble else None,
-            "N_liquid": n_liq,
-            "N_vap": n_vap if n_vap else None,
-            "box_L_liq": np.round(
-                liq_box_L.to_value("nm"),
-                decimals=3,
-            ).item()
-            if liq_box_L
-            else None,
-            "box_L_vap": np.round(
-                vap_box_L.to_value("nm"),
-                decimals=3,
-            ).item()
-            if vap_box_L
-            else None,
-            "init_liq_den": np.round(
-                init_liq_den.to_value(g_per_cm3),
-                decimals=3,
-            ).item(),
-            "init_vap_den": np.round(
-                init_vap_den.to_value(g_per_cm3),
-                decimals=3,
-            ).item()
-            if init_vap_den
-            else None,
-            "mass": np.round(
-                mass.to_value("amu"),
-                decimals=3,
-            ).item(),
-            "forcefield_name": forcefields[molecule],
-            "cutoff_style": cutoff_style,
-            "r_cut": np.round(
-                r_cuts[molecule].to_value("nm"),
-                decimals=3,
-            ).item(),
-        }
-        total_statepoints.append(statepoint)
-
-# print(len(total_statepoints))
-indices_to_remove = set()
-for i, sp in enumerate(total_statepoints):
-    # filter gemc ensembles from md engines
-    if sp["ensemble"] == "GEMC-NVT" and sp["engine"] in md_engines:
-        indices_to_remove.add(i)
-
-    if sp["ensemble"] == "NPT":
-        sp["N_vap"] = None
-        sp["box_L_vap"] = None
-        sp["init_vap_den"] = None
-
-    if sp["ensemble"] is None:
-        indices_to_remove.add(i)
-
-
-# now reverse sort the set and remove from inital list
-# must be reverse sorted to remove indices on the list in place
-# otherwise the list will change size and the indices would change
-# print(len(indices_to_remove))
-sorted_indicies_to_delete = sorted(list(indices_to_remove), reverse=True)
-for idx in sorted_indicies_to_delete:
-    del total_statepoints[idx]
-
-for sp in total_statepoints:
-    pr.open_job(
-        statepoint=sp,
-    ).init()
+# Constraints on (engine, ensemble) pairs, applied before the remaining
+# statepoint fields are expanded, so invalid statepoints are never generated.
+constraints = [
+    # ensembles not being tested for a molecule are None
+    lambda engine, ensemble: ensemble is not None,
+    # gemc only with mc engines
+    lambda engine, ensemble: not (
+        ensemble == "GEMC-NVT" and engine in md_engines
+    ),
+]
+
+
+def generate_statepoints():
+    """Yield the statepoints of the study that satisfy all constraints."""
+    for molecule in molecules:
+        for engine, ensemble in itertools.product(
+            simulation_engines, ensembles[molecule]
+        ):
+            if not all(
+                constraint(engine, ensemble) for constraint in constraints
+            ):
+                continue
+            for (
+                (temp, press),
+                n_liq,
+                liq_box_L,
+                n_vap,
+                vap_box_L,
+                (init_liq_den, init_vap_den),
+                mass,
+                cutoff_style,
+            ) in itertools.product(
+                zip(temperatures[molecule], pressures[molecule]),
+                N_liq_molecules[molecule],
+                liq_box_lengths[molecule],
+                N_vap_molecules[molecule],
+                vap_box_lengths[molecule],
+                zip(init_density_liq[molecule], init_density_vap[molecule]),
+                masses[molecule],
+                cutoff_styles,
+            ):
+                statepoint = {
+                    "molecule": molecule,
+                    "engine": engine,
+                    "temperature": np.round(
+                        temp.to_value("K"),
+                        decimals=3,
+                    ).item(),
+                    "pressure": np.round(
+                        press.to_value("kPa"), decimals=3
+                    ).item(),
+                    "ensemble": ensemble,
+                    "N_liquid": n_liq,
+                    "N_vap": n_vap if n_vap else None,
+                    "box_L_liq": np.round(
+                        liq_box_L.to_value("nm"),
+                        decimals=3,
+                    ).item()
+                    if liq_box_L
+                    else None,
+                    "box_L_vap": np.round(
+                        vap_box_L.to_value("nm"),
+                        decimals=3,
+                    ).item()
+                    if vap_box_L
+                    else None,
+                    "init_liq_den": np.round(
+                        init_liq_den.to_value(g_per_cm3),
+                        decimals=3,
+                    ).item(),
+                    "init_vap_den": np.round(
+                        init_vap_den.to_value(g_per_cm3),
+                        decimals=3,
+                    ).item()
+                    if init_vap_den
+                    else None,
+                    "mass": np.round(
+                        mass.to_value("amu"),
+                        decimals=3,
+                    ).item(),
+                    "forcefield_name": forcefields[molecule],
+                    "cutoff_style": cutoff_style,
+                    "r_cut": np.round(
+                        r_cuts[molecule].to_value("nm"),
+                        decimals=3,
+                    ).item(),
+                }
+                if ensemble == "NPT":
+                    statepoint["N_vap"] = None
+                    statepoint["box_L_vap"] = None
+                    statepoint["init_vap_den"] = None
+                # Only the replica differs between these statepoints.
+                for replica in replicas:
+                    yield {**statepoint, "replica": replica}
+
+
+def init_jobs(project, statepoints, n_workers=16):
+    """Initialize the jobs of the statepoints missing from the project.
+
+    The job ids of the statepoints are computed without touching the
+    workspace and compared with the ids of the existing jobs, which are
+    listed once. Only the new jobs are initialized, in parallel threads since
+    the cost is dominated by filesystem latency.
+
+    Returns
+    -------
+    list of signac.contrib.job.Job
+        The newly initialized jobs.
+    """
+    existing = {job.id for job in project.find_jobs()}
+    new_jobs = {}
+    for statepoint in statepoints:
+        job = project.open_job(statepoint=statepoint)
+        if job.id not in existing:
+            new_jobs[job.id] = job
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        list(executor.map(lambda job: job.init(), new_jobs.values()))
+    return list(new_jobs.values())
+
+
+if __name__ == "__main__":
+    pr_root = os.path.join(os.getcwd(), "src")
+    pr = signac.get_project(pr_root)
+    init_jobs(pr, generate_statepoints())
@@ -1,4 +1,10 @@
 """Analysis routines and helper methods."""
 from reproducibility_project.src.analysis.equlibration import *
-from reproducibility_project.src.analysis.rdf import gsd_rdf
+from reproducibility_project.src.analysis.monitor import monitor_job
+from reproducibility_project.src.analysis.rdf import gsd_partial_rdf, gsd_rdf
 from reproducibility_project.src.analysis.sampler import sample_job
+from reproducibility_project.src.analysis.thermo_log import (
+    read_gsd_log,
+    read_log_column,
+)
+from reproducibility_project.src.analysis.trajectory import iter_frames
@@ -1,13 +1,21 @@
 """Timeseries and pyMBAR related methods."""
-from typing import List
+from typing import List, Optional, Sequence, Tuple
 
 import numpy as np
 import numpy.typing as npt
 from pymbar import timeseries
+from pymbar.utils import ParameterError
+
+_METHODS = ("pymbar", "cumsum")
+_SEARCHES = ("exhaustive", "adaptive")
 
 
 def is_equilibrated(
-    a_t: npt.ArrayLike, threshold: float = 0.8, nskip: int = 1
+    a_t: npt.ArrayLike,
+    threshold: float = 0.8,
+    nskip: int = 1,
+    method: str = "pymbar",
+    search: str = "exhaustive",
 ) -> List:
     """Check if a dataset is equilibrated based on a fraction of equil data.
 
@@ -33,13 +41,41 @@ def is_equilibrated(
         in a call to timeseries.detectEquilibration, for larger datasets
         (> few hundred), increasing nskip might speed this up, while
         discarding more data.
+    method : str, optional, default="pymbar"
+        Backend used to detect the start of the production region.
+        "pymbar" calls timeseries.detectEquilibration directly, which
+        recomputes the statistical inefficiency for every time origin.
+        "cumsum" evaluates every time origin at once from suffix cumulative
+        sums of the lagged products, which is much faster for long datasets
+        and follows the same estimator as pymbar.
+    search : str, optional, default="exhaustive"
+        How candidate time origins are chosen. "exhaustive" tests every
+        nskip-th time origin. "adaptive" tests a coarse logarithmic grid of
+        time origins and then only refines around the maximum of the
+        effective sample count, down to a resolution of nskip. It evaluates
+        O(log N) time origins instead of O(N / nskip).
     """
     if threshold < 0.0 or threshold > 1.0:
         raise ValueError(
             f"Passed 'threshold' value: {threshold}, expected value between 0.0-1.0."
         )
+    if method not in _METHODS:
+        raise ValueError(
+            f"Passed 'method' value: {method}, expected one of {_METHODS}."
+        )
+    if search not in _SEARCHES:
+        raise ValueError(
+            f"Passed 'search' value: {search}, expected one of {_SEARCHES}."
+        )
 
-    [t0, g, _] = timeseries.detectEquilibration(a_t, nskip=nskip)
+    if search == "adaptive":
+        [t0, g, _] = _detect_equilibration_adaptive(
+            a_t, nskip=nskip, method=method
+        )
+    elif method == "pymbar":
+        [t0, g, _] = timeseries.detectEquilibration(a_t, nskip=nskip)
+    else:
+        [t0, g, _] = _detect_equilibration_cumsum(a_t, nskip=nskip)
     frac_equilibrated = 1.0 - (t0 / np.shape(a_t)[0])
 
     if frac_equilibrated >= threshold:
@@ -49,7 +85,11 @@ def is_equilibrated(
 
 
 def trim_non_equilibrated(
-    a_t: npt.ArrayLike, threshold: float = 0.75, nskip: int = 1
+    a_t: npt.ArrayLike,
+    threshold: float = 0.75,
+    nskip: int = 1,
+    method: str = "pymbar",
+    search: str = "exhaustive",
 ) -> List:
     """Prune timeseries array to just the production data.
 
@@ -74,12 +114,289 @@ def trim_non_equilibrated(
         in a call to timeseries.detectEquilibration, for larger datasets
         (> few hundred), increasing nskip might speed this up, while
         discarding more data.
+    method : str, optional, default="pymbar"
+        Backend used to detect the start of the production region, either
+        "pymbar" or "cumsum". Refer to equilibration.is_equilibrated.
+    search : str, optional, default="exhaustive"
+        How candidate time origins are chosen, either "exhaustive" or
+        "adaptive". Refer to equilibration.is_equilibrated.
 
     """
-    [truth, t0, g] = is_equilibrated(a_t, threshold=threshold, nskip=nskip)
+    [truth, t0, g] = is_equilibrated(
+        a_t, threshold=threshold, nskip=nskip, method=method, search=search
+    )
     if not truth:
         raise ValueError(
             f"Data with a threshold of {threshold} is not equilibrated!"
         )
 
     return [a_t[t0:], g, t0]
+
+
+def is_equilibrated_multi(
+    data: npt.ArrayLike,
+    threshold: float = 0.8,
+    nskip: int = 1,
+    columns: Optional[Sequence] = None,
+    search: str = "exhaustive",
+) -> List:
+    """Check several observables for equilibration in one vectorized pass.
+
+    Batched version of equilibration.is_equilibrated using the "cumsum"
+    backend. The time origin t0 and statistical inefficiency g of every
+    column are computed together, so checking e.g. the potential energy,
+    pressure, volume and temperature of a simulation log costs about the
+    same as checking a single observable.
+
+    This method returns a list of length 2, where list[0] is a dictionary
+    mapping each column to the list [truth, t0, g] that
+    equilibration.is_equilibrated would return for it, and list[1] is the
+    consensus start of the production region, i.e. the latest t0 across
+    all columns.
+
+    Parameters
+    ----------
+    data : numpy.typing.Arraylike
+        Either a 2-D array of shape (n_samples, n_observables), or a
+        structured array with named fields such as the one returned by
+        `np.genfromtxt(..., names=True)`.
+    threshold : float, optional, default=0.8
+        Fraction of data expected to be equilibrated.
+    nskip : int, optional, default=1
+        Stride between the time origins that are tested. Refer to
+        equilibration.is_equilibrated.
+    columns : sequence, optional, default=None
+        Field names (structured arrays) or column indices (2-D arrays) to
+        check. If None, every column is checked.
+    search : str, optional, default="exhaustive"
+        How candidate time origins are chosen, either "exhaustive" or
+        "adaptive". Refer to equilibration.is_equilibrated.
+    """
+    if threshold < 0.0 or threshold > 1.0:
+        raise ValueError(
+            f"Passed 'threshold' value: {threshold}, expected value between 0.0-1.0."
+        )
+    if search not in _SEARCHES:
+        raise ValueError(
+            f"Passed 'search' value: {search}, expected one of {_SEARCHES}."
+        )
+
+    data = np.asarray(data)
+    if data.dtype.names is not None:
+        if columns is None:
+            columns = list(data.dtype.names)
+        a_t = np.column_stack([data[name] for name in columns])
+    elif data.ndim == 2:
+        if columns is None:
+            columns = list(range(data.shape[1]))
+        a_t = data[:, list(columns)]
+    else:
+        raise ValueError(
+            f"Expected a 2-D or structured array, got an array of shape {data.shape}."
+        )
+
+    if search == "adaptive":
+        [t0s, gs, _] = _detect_equilibration_adaptive(a_t, nskip=nskip)
+    else:
+        [t0s, gs, _] = _detect_equilibration_cumsum(a_t, nskip=nskip)
+    n_samples = np.shape(a_t)[0]
+    results = {}
+    for column, t0, g in zip(columns, t0s, gs):
+        frac_equilibrated = 1.0 - (t0 / n_samples)
+        results[column] = [bool(frac_equilibrated >= threshold), int(t0), g]
+
+    return [results, int(np.max(t0s))]
+
+
+def _detect_equilibration_cumsum(
+    a_t: npt.ArrayLike, nskip: int = 1, mintime: int = 3
+) -> Tuple:
+    """Vectorized equivalent of `pymbar.timeseries.detectEquilibration`.
+
+    Returns the same (t0, g, Neff_max) tuple as pymbar (with fast=True), but
+    the statistical inefficiency of every candidate time origin is computed
+    in a single pass over the lag times instead of one call per origin.
+    If a_t is 2-D, each column is treated as a separate timeseries and the
+    tuple holds one array entry per column.
+    """
+    a_t = np.asarray(a_t, dtype=np.float64)
+    T = a_t.shape[0]
+    x = a_t.reshape(T, -1)
+
+    origins = np.arange(0, T - 1, nskip)
+    g_t = _statistical_inefficiencies(x, origins, mintime=mintime)
+    neff_t = (T - origins + 1)[:, None] / g_t
+    idx = np.argmax(neff_t, axis=0)
+    cols = np.arange(x.shape[1])
+    t0 = origins[idx]
+    g = g_t[idx, cols]
+    neff = neff_t[idx, cols]
+
+    # Special case if timeseries is constant, as in pymbar.
+    constant = x.std(axis=0) == 0.0
+    t0[constant] = 0
+    g[constant] = 1
+    neff[constant] = 1
+
+    if a_t.ndim == 1:
+        return (int(t0[0]), g[0], neff[0])
+    return (t0, g, neff)
+
+
+def _detect_equilibration_adaptive(
+    a_t: npt.ArrayLike,
+    nskip: int = 1,
+    method: str = "cumsum",
+    n_grid: int = 32,
+    n_refine: int = 5,
+) -> Tuple:
+    """Coarse-to-fine variant of `_detect_equilibration_cumsum`.
+
+    The effective sample count (T - t0 + 1) / g is first evaluated on a
+    coarse logarithmic grid of time origins. The grid is then repeatedly
+    refined between the neighbours of the n_refine largest values, n_grid
+    points at a time, until the spacing around them is nskip. Time origins are
+    multiples of nskip, as in the exhaustive search. If a_t is 2-D, each
+    column is refined separately but the statistical inefficiencies of the
+    union of their time origins are computed together. The "pymbar" method
+    only supports 1-D data.
+    """
+    a_t = np.asarray(a_t, dtype=np.float64)
+    T = a_t.shape[0]
+    x = a_t.reshape(T, -1)
+    if method == "pymbar" and x.shape[1] != 1:
+        raise ValueError("The 'pymbar' method only supports 1-D data.")
+
+    # Logarithmic grid that is dense at both ends of the timeseries, since
+    # short trailing segments can also maximize the effective sample count.
+    grid = np.geomspace(1, T - 1, n_grid).astype(int)
+    origins = np.concatenate([grid - 1, T - 1 - grid])
+    origins = np.unique(origins // nskip * nskip)
+    evaluated = np.empty(0, dtype=int)
+    g_t = np.empty((0, x.shape[1]))
+    while origins.size:
+        if method == "pymbar":
+            g_new = _pymbar_inefficiencies(x[:, 0], origins)[:, None]
+        else:
+            g_new = _statistical_inefficiencies(x, origins)
+        evaluated = np.concatenate([evaluated, origins])
+        g_t = np.concatenate([g_t, g_new])
+        order = np.argsort(evaluated, kind="stable")
+        evaluated = evaluated[order]
+        g_t = g_t[order]
+
+        # Refine between the evaluated neighbours of the n_refine largest
+        # effective sample counts of each column.
+        neff_t = (T - evaluated + 1)[:, None] / g_t
+        best = np.argsort(-neff_t, axis=0, kind="stable")[:n_refine]
+        candidates = []
+        for i in np.unique(best):
+            lo = evaluated[max(i - 1, 0)]
+            hi = evaluated[min(i + 1, evaluated.size - 1)]
+            step = max((hi - lo) // n_grid // nskip, 1) * nskip
+            candidates.append(np.arange(lo, hi + 1, step))
+        origins = np.setdiff1d(np.concatenate(candidates), evaluated)
+
+    neff_t = (T - evaluated + 1)[:, None] / g_t
+    idx = np.argmax(neff_t, axis=0)
+    cols = np.arange(x.shape[1])
+    t0 = evaluated[idx]
+    g = g_t[idx, cols]
+    neff = neff_t[idx, cols]
+
+    # Special case if timeseries is constant, as in pymbar.
+    constant = x.std(axis=0) == 0.0
+    t0[constant] = 0
+    g[constant] = 1
+    neff[constant] = 1
+
+    if a_t.ndim == 1:
+        return (int(t0[0]), g[0], neff[0])
+    return (t0, g, neff)
+
+
+def _pymbar_inefficiencies(a_t: np.ndarray, origins: np.ndarray) -> np.ndarray:
+    """Compute the statistical inefficiency of a_t[t0:] with pymbar."""
+    T = a_t.size
+    g = np.empty(origins.size)
+    for i, t0 in enumerate(origins):
+        try:
+            g[i] = timeseries.statisticalInefficiency(a_t[t0:], fast=True)
+        except ParameterError:
+            g[i] = T - t0 + 1
+    return g
+
+
+def _statistical_inefficiencies(
+    x: np.ndarray, origins: np.ndarray, mintime: int = 3
+) -> np.ndarray:
+    """Compute the statistical inefficiency of x[t0:] for every t0 in origins.
+
+    This follows `pymbar.timeseries.statisticalInefficiency` with fast=True:
+    the normalized autocorrelation C(t) is accumulated at lag times
+    t = 1, 2, 4, 7, ... (weighted by the growing increment) until it drops
+    to zero after mintime. For each lag, the sum of the lagged products of
+    every trailing segment x[t0:] is read from one suffix cumulative sum,
+    so the cost per lag is O(N) regardless of the number of origins.
+
+    x has shape (n_samples, n_columns) and the returned array has shape
+    (len(origins), n_columns).
+    """
+    # C(t) is invariant under a constant shift, so center on the global mean
+    # to limit cancellation in the cumulative sums below.
+    x = x - x.mean(axis=0)
+    T = x.shape[0]
+    n = (T - origins)[:, None]
+
+    # s1[i] = sum(x[i:]) and s2[i] = sum(x[i:] ** 2), with s1[T] = s2[T] = 0.
+    s1 = _suffix_sum(x)
+    s2 = _suffix_sum(x * x)
+    mu = s1[origins] / n
+    mean_sq = s2[origins] / n
+    sigma2 = mean_sq - mu * mu
+
+    # pymbar raises a ParameterError for a zero variance segment and
+    # detectEquilibration then assigns g = T - t0 + 1 (pymbar issue #122).
+    degenerate = sigma2 <= np.finfo(np.float64).eps * mean_sq
+
+    g = np.ones(sigma2.shape)
+    active = ~degenerate
+    t = 1
+    increment = 1
+    while True:
+        # Origins are sorted, so those with a segment longer than t + 1
+        # form a prefix of the origins array.
+        k = np.count_nonzero(n[:, 0] - 1 > t)
+        active[k:] = False
+        if not active[:k].any():
+            break
+        t0 = origins[:k]
+        m = n[:k]
+        mu_k = mu[:k]
+
+        # sum_{i=t0}^{T-1-t} (x_i - mu)(x_{i+t} - mu) for every origin
+        lagged_sum = _suffix_sum(x[: T - t] * x[t:])[t0]
+        head_sum = s1[t0] - s1[T - t]
+        tail_sum = s1[t0 + t]
+        lagged = lagged_sum - mu_k * (head_sum + tail_sum) + (m - t) * mu_k**2
+        with np.errstate(divide="ignore", invalid="ignore"):
+            C = lagged / ((m - t) * sigma2[:k])
+
+        stop = active[:k] & (C <= 0.0) & (t > mintime)
+        keep = active[:k] & ~stop
+        g[:k] += np.where(keep, 2.0 * C * (1.0 - t / m) * float(increment), 0)
+        active[:k] &= ~stop
+
+        t += increment
+        increment += 1
+
+    g = np.maximum(g, 1.0)
+    g = np.where(degenerate, (T - origins + 1)[:, None], g)
+    return g
+
+
+def _suffix_sum(x: np.ndarray) -> np.ndarray:
+    """Return s with s[i] = sum(x[i:]) along axis 0 and a trailing zero row."""
+    s = np.zeros((x.shape[0] + 1,) + x.shape[1:])
+    s[:-1] = np.cumsum(x[::-1], axis=0)[::-1]
+    return s
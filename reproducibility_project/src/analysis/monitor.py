@@ -0,0 +1,217 @@
+"""Incrementally follow a growing thermo log to monitor equilibration."""
+import json
+import os
+
+import numpy as np
+
+from reproducibility_project.src.analysis.equlibration import (
+    _detect_equilibration_cumsum,
+)
+from reproducibility_project.src.analysis.thermo_log import (
+    _log_fingerprint,
+    _parse_log_lines,
+)
+
+
+def monitor_job(
+    job,
+    variable="potential_energy",
+    threshold=0.75,
+    filename="log.txt",
+    max_blocks=1024,
+):
+    """Report the equilibration state of a running job from its thermo log.
+
+    Only the rows appended to the log since the previous call are read. They
+    are accumulated into block averages whose block size doubles whenever
+    `max_blocks` blocks are filled, so the state stays bounded no matter how
+    long the simulation runs. The state is persisted next to the log (as
+    "<filename>.monitor.json") and survives restarts of the monitoring
+    process. Repeated headers written by restarted simulations appending to
+    the same log are skipped.
+
+    The equilibration detection of
+    equilibration.is_equilibrated(method="cumsum") is applied to the block
+    averages of `variable`. The result is added to the job document under
+    "monitor_results" and returned as a dictionary with the keys
+    "equilibrated", "t0" (in rows of the log), "g" (in blocks),
+    "block_size", "n_samples" and "n_decorrelated".
+
+    Parameters
+    ----------
+    job : signac.contrib.job.Job
+        The Job object.
+    variable : str; default "potential_energy"
+        The variable to be monitored.
+    threshold : float, optional, default=0.75
+        Fraction of data expected to be equilibrated.
+    filename : str, optional, default="log.txt"
+        Name of the whitespace delimited log in the job workspace.
+    max_blocks : int, optional, default=1024
+        Maximum number of block averages kept per column, must be even.
+    """
+    if threshold < 0.0 or threshold > 1.0:
+        raise ValueError(
+            f"Passed 'threshold' value: {threshold}, expected value between 0.0-1.0."
+        )
+    if max_blocks < 2 or max_blocks % 2:
+        raise ValueError(
+            f"Passed 'max_blocks' value: {max_blocks}, expected an even value >= 2."
+        )
+
+    state_fn = job.fn(f"{filename}.monitor.json")
+    state = _load_state(state_fn, max_blocks)
+    state = _consume_log(state, job.fn(filename))
+    _save_state(state, state_fn)
+
+    if state["names"] is None or variable not in state["names"]:
+        raise ValueError(f"Variable {variable} not found in {filename}.")
+
+    result = _monitor_result(state, state["names"].index(variable), threshold)
+    try:
+        job.doc["monitor_results"]
+    except KeyError:
+        job.doc["monitor_results"] = {}
+    job.doc["monitor_results"][variable] = result
+    return result
+
+
+def _monitor_result(state, column, threshold, min_blocks=8):
+    """Run the equilibration detection on the block averages of a column."""
+    blocks = np.asarray(state["blocks"], dtype=np.float64).reshape(
+        -1, len(state["names"])
+    )[:, column]
+    result = {
+        "equilibrated": False,
+        "t0": None,
+        "g": None,
+        "block_size": state["block_size"],
+        "n_samples": state["n_rows"],
+        "n_decorrelated": 0,
+    }
+    if len(blocks) < min_blocks:
+        return result
+
+    [t0, g, _] = _detect_equilibration_cumsum(blocks)
+    frac_equilibrated = 1.0 - (t0 / len(blocks))
+    result["equilibrated"] = bool(frac_equilibrated >= threshold)
+    result["t0"] = int(t0 * state["block_size"])
+    result["g"] = float(g)
+    result["n_decorrelated"] = int((len(blocks) - t0) / g)
+    return result
+
+
+def _new_state(max_blocks):
+    """Return the monitor state of an empty log."""
+    return {
+        "offset": 0,
+        "fingerprint": None,
+        "names": None,
+        "n_rows": 0,
+        "max_blocks": max_blocks,
+        "block_size": 1,
+        "blocks": [],
+        "partial_sum": None,
+        "partial_count": 0,
+    }
+
+
+def _load_state(state_fn, max_blocks):
+    """Load a persisted monitor state, or start from an empty log."""
+    if os.path.isfile(state_fn):
+        with open(state_fn, "r") as f:
+            state = json.load(f)
+        if state["max_blocks"] == max_blocks:
+            return state
+    return _new_state(max_blocks)
+
+
+def _save_state(state, state_fn):
+    """Atomically persist the monitor state."""
+    tmp_fn = state_fn + ".tmp"
+    with open(tmp_fn, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp_fn, state_fn)
+
+
+def _consume_log(state, log_fn):
+    """Add the complete rows appended to the log since the last call."""
+    if not os.path.isfile(log_fn):
+        return state
+    if state["offset"] and (
+        os.path.getsize(log_fn) < state["offset"]
+        or state.get("fingerprint") != _log_fingerprint(log_fn, state["offset"])
+    ):
+        # The log was truncated or replaced, start over.
+        state = _new_state(state["max_blocks"])
+
+    with open(log_fn, "rb") as f:
+        f.seek(state["offset"])
+        chunk = f.read()
+
+    # Leave an incomplete trailing line for the next call.
+    end = chunk.rfind(b"\n") + 1
+    state["offset"] += end
+    state["fingerprint"] = _log_fingerprint(log_fn, state["offset"])
+
+    state["names"], rows = _parse_log_lines(
+        chunk[:end].decode(), state["names"]
+    )
+    if len(rows):
+        _add_rows(state, rows)
+    return state
+
+
+def _add_rows(state, rows):
+    """Accumulate rows into the block averages, coarsening as needed."""
+    n_cols = rows.shape[1]
+    blocks = np.asarray(state["blocks"], dtype=np.float64).reshape(-1, n_cols)
+    if state["partial_sum"] is None:
+        partial_sum = np.zeros(n_cols)
+    else:
+        partial_sum = np.asarray(state["partial_sum"], dtype=np.float64)
+    partial_count = state["partial_count"]
+    block_size = state["block_size"]
+    max_blocks = state["max_blocks"]
+
+    i = 0
+    while i < len(rows):
+        if partial_count:
+            take = rows[i : i + block_size - partial_count]
+            partial_sum += take.sum(axis=0)
+            partial_count += len(take)
+            i += len(take)
+            if partial_count == block_size:
+                blocks = np.vstack([blocks, partial_sum / block_size])
+                partial_sum = np.zeros(n_cols)
+                partial_count = 0
+        else:
+            n_full = min(
+                (len(rows) - i) // block_size, max_blocks - len(blocks)
+            )
+            if n_full:
+                full = rows[i : i + n_full * block_size]
+                blocks = np.vstack(
+                    [
+                        blocks,
+                        full.reshape(n_full, block_size, n_cols).mean(axis=1),
+                    ]
+                )
+                i += n_full * block_size
+            else:
+                partial_sum = rows[i:].sum(axis=0)
+                partial_count = len(rows) - i
+                i = len(rows)
+
+        if len(blocks) >= max_blocks:
+            # Merge neighbouring blocks, a pending partial block stays valid
+            # since it holds fewer rows than the new block size.
+            blocks = blocks.reshape(-1, 2, n_cols).mean(axis=1)
+            block_size *= 2
+
+    state["n_rows"] += len(rows)
+    state["blocks"] = blocks.ravel().tolist()
+    state["partial_sum"] = partial_sum.tolist()
+    state["partial_count"] = partial_count
+    state["block_size"] = block_size
+    return state
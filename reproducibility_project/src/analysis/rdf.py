@@ -1,13 +1,35 @@
 """Facilitate the calculation of the RDF from simulation data."""
 
+import hashlib
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
 import freud
 import gsd
 import gsd.hoomd
 import matplotlib.pyplot as plt
 import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+from reproducibility_project.src.analysis.trajectory import (
+    count_frames,
+    iter_frames,
+    last_box,
+)
 
 
-def gsd_rdf(job, frames=10, stride=1, bins=50, r_min=0.5, r_max=None):
+def gsd_rdf(
+    job,
+    frames=10,
+    stride=1,
+    bins=50,
+    r_min=0.5,
+    r_max=None,
+    n_workers=1,
+    cache=False,
+    n_blocks=None,
+):
     """Compute the RDF given a Signac Job object.
 
     The job folder is expected to contain the file "trajectory.gsd" with lengths
@@ -17,6 +39,17 @@ def gsd_rdf(job, frames=10, stride=1, bins=50, r_min=0.5, r_max=None):
     After execution, the files "rdf.png" and "rdf.txt" are created in the job
     folder.
 
+    If cache is True, the raw pair counts of every frame are stored in the
+    file "rdf_frames.npz" in the job folder, together with the binning
+    parameters and a fingerprint of each frame (a hash of its timestep, box
+    and positions). A rerun only computes the frames missing from that file
+    (e.g. frames appended to the trajectory since the last call) or whose
+    fingerprint changed (e.g. frames rewritten after a restart), and
+    reassembles the average from the stored counts. The stored counts are
+    discarded if the binning changes. If r_max is None, the value computed on the first call
+    is stored and reused, so that appending frames with a different box
+    (e.g. in NPT runs) does not change the binning.
+
     Parameters
     ----------
     job : signac.contrib.job.Job
@@ -33,13 +66,44 @@ def gsd_rdf(job, frames=10, stride=1, bins=50, r_min=0.5, r_max=None):
     r_max : float, default None
         The maximum distance (in nm) to calculate the RDF. If None is provided,
         the minimum box length times a factor of 0.45 will be used.
+    n_workers : int, default 1
+        The number of processes the frames are split across. If 1, the
+        frames are computed serially with freud.
+    cache : bool, default False
+        Whether to store and reuse the pair counts of every frame.
+    n_blocks : int, default None
+        If provided, the frames are split into n_blocks contiguous blocks and
+        the standard error of the block averages is stored as `rdf.rdf_err`
+        and as a third column of "rdf.txt".
 
     Returns
     -------
-    freud.density.RDF
-        Computed RDF object
+    freud.density.RDF or ReducedRDF
+        Computed RDF object, a freud.density.RDF if cache is False,
+        n_workers is 1 and n_blocks is None and a ReducedRDF otherwise.
     """
-    rdf = _gsd_rdf(job.fn("trajectory.gsd"), frames, stride, bins, r_min, r_max)
+    if cache or n_blocks:
+        rdf = _gsd_rdf_per_frame(
+            job.fn("trajectory.gsd"),
+            frames,
+            stride,
+            bins,
+            r_min,
+            r_max,
+            n_workers,
+            cache_file=job.fn("rdf_frames.npz") if cache else None,
+            n_blocks=n_blocks,
+        )
+    else:
+        rdf = _gsd_rdf(
+            job.fn("trajectory.gsd"),
+            frames,
+            stride,
+            bins,
+            r_min,
+            r_max,
+            n_workers,
+        )
 
     fig, ax = plt.subplots()
     ax.plot(rdf.bin_centers, rdf.rdf)
@@ -49,23 +113,466 @@ def gsd_rdf(job, frames=10, stride=1, bins=50, r_min=0.5, r_max=None):
 
     fig.savefig(job.fn("rdf.png"))
 
-    rdf_array = np.vstack((rdf.bin_centers, rdf.rdf)).T
+    if n_blocks:
+        rdf_array = np.vstack((rdf.bin_centers, rdf.rdf, rdf.rdf_err)).T
+    else:
+        rdf_array = np.vstack((rdf.bin_centers, rdf.rdf)).T
     np.savetxt(job.fn("rdf.txt"), rdf_array)
     return rdf
 
 
-def _gsd_rdf(gsdfile, frames=10, stride=1, bins=50, r_min=0.5, r_max=None):
-    """Compute the RDF given a GSD file."""
+def gsd_partial_rdf(
+    job,
+    frames=10,
+    stride=1,
+    bins=50,
+    r_min=0.5,
+    r_max=None,
+    exclude_intramolecular=True,
+):
+    """Compute the partial RDF of every particle type pair given a Signac Job.
+
+    The job folder is expected to contain the file "trajectory.gsd". Pairs of
+    particles in the same molecule are excluded, where molecules are the
+    connected components of the bond topology (`frame.bonds.group`).
+    After execution, the file "rdf_partial.txt" is created in the job folder,
+    holding the bin centers followed by one column per type pair, labeled
+    in its header (e.g. "r CH3-CH3 CH3-CH2 CH2-CH2").
+
+    Parameters
+    ----------
+    job : signac.contrib.job.Job
+        The Job object.
+    frames : int, default 10
+        The number of frames from the trajectory to average. Up to and always
+        uses the last frame.
+    stride : int, default 1
+        The step size between frames
+    bins : int, default 50
+        The number of bins in the RDF histogram.
+    r_min : float, default 0.5
+        The minimum distance (in nm) to calculate the RDF.
+    r_max : float, default None
+        The maximum distance (in nm) to calculate the RDF. If None is provided,
+        the minimum box length times a factor of 0.45 will be used.
+    exclude_intramolecular : bool, default True
+        Whether to exclude pairs of particles in the same molecule.
+
+    Returns
+    -------
+    bin_centers : numpy.ndarray
+        The centers of the RDF histogram bins (in nm).
+    rdfs : dict
+        The partial RDF of each type pair, keyed by "<type_a>-<type_b>".
+    """
+    bin_centers, rdfs = _gsd_partial_rdf(
+        job.fn("trajectory.gsd"),
+        frames,
+        stride,
+        bins,
+        r_min,
+        r_max,
+        exclude_intramolecular,
+    )
+    np.savetxt(
+        job.fn("rdf_partial.txt"),
+        np.column_stack([bin_centers] + list(rdfs.values())),
+        header=" ".join(["r"] + list(rdfs)),
+    )
+    return bin_centers, rdfs
+
+
+def _gsd_partial_rdf(
+    gsdfile,
+    frames=10,
+    stride=1,
+    bins=50,
+    r_min=0.5,
+    r_max=None,
+    exclude_intramolecular=True,
+):
+    """Compute the partial RDFs of every type pair given a GSD file.
+
+    Each frame needs a single neighbor query, whose pairs are binned by type
+    pair and distance in one histogram. The pair densities are accumulated
+    per frame, so the normalization follows the box volume of each frame.
+    """
+    with gsd.hoomd.open(gsdfile) as trajectory:
+        if r_max is None:
+            r_max = min(trajectory[-1].configuration.box[:3]) * 0.45
+        bin_edges = np.linspace(r_min, r_max, bins + 1)
+        types = trajectory[-1].particles.types
+        n_types = len(types)
+        counts = np.zeros((n_types, n_types, bins))
+        pair_densities = np.zeros((n_types, n_types))
+
+        for i in _frame_indices(len(trajectory), frames, stride):
+            frame = trajectory[i]
+            typeid = frame.particles.typeid.astype(int)
+            box = freud.box.Box.from_box(frame.configuration.box)
+            nlist = (
+                freud.locality.AABBQuery(box, frame.particles.position)
+                .query(
+                    frame.particles.position,
+                    {"r_max": r_max, "r_min": r_min, "exclude_ii": True},
+                )
+                .toNeighborList()
+            )
+            query_i = nlist.query_point_indices
+            point_j = nlist.point_indices
+            distances = nlist.distances
+            if exclude_intramolecular:
+                molecules = _molecule_ids(frame)
+                inter = molecules[query_i] != molecules[point_j]
+                query_i = query_i[inter]
+                point_j = point_j[inter]
+                distances = distances[inter]
+
+            bin_idx = np.floor(
+                (distances - r_min) / (r_max - r_min) * bins
+            ).astype(int)
+            valid = (bin_idx >= 0) & (bin_idx < bins)
+            flat = (
+                typeid[query_i] * n_types + typeid[point_j]
+            ) * bins + bin_idx
+            counts += np.bincount(
+                flat[valid], minlength=n_types * n_types * bins
+            ).reshape(n_types, n_types, bins)
+
+            n_of_type = np.bincount(typeid, minlength=n_types)
+            pair_densities += np.outer(n_of_type, n_of_type) / box.volume
+
+    shell_volumes = 4 / 3 * np.pi * (bin_edges[1:] ** 3 - bin_edges[:-1] ** 3)
+    bin_centers = (bin_edges[1:] + bin_edges[:-1]) / 2
+    rdfs = {}
+    for a in range(n_types):
+        for b in range(a, n_types):
+            if pair_densities[a, b] == 0:
+                continue
+            rdfs[f"{types[a]}-{types[b]}"] = counts[a, b] / (
+                pair_densities[a, b] * shell_volumes
+            )
+    return bin_centers, rdfs
+
+
+def _molecule_ids(frame):
+    """Return the molecule index of every particle from the bond topology."""
+    n = frame.particles.N
+    group = np.asarray(frame.bonds.group, dtype=int).reshape(-1, 2)
+    graph = coo_matrix(
+        (np.ones(len(group)), (group[:, 0], group[:, 1])), shape=(n, n)
+    )
+    _, labels = connected_components(graph, directed=False)
+    return labels
+
+
+def _frame_indices(n_frames, frames, stride):
+    """Return the indices of the last `frames` frames spaced by `stride`."""
+    start = -(frames * stride) + stride - 1
+    return range(n_frames)[start::stride]
+
+
+class ReducedRDF:
+    """Frame-averaged RDF reduced from partial pair-count histograms.
+
+    Mirrors the attributes of freud.density.RDF used in this project and
+    follows freud's normalization, so the result matches a serial
+    freud.density.RDF accumulated over the same frames.
+
+    Parameters
+    ----------
+    bin_edges : numpy.ndarray
+        The edges of the RDF histogram bins (in nm).
+    bin_counts : numpy.ndarray
+        The pair counts per bin summed over all frames.
+    n_frames : int
+        The number of frames the pair counts were summed over.
+    n_points : int
+        The number of particles in the last frame.
+    volume : float
+        The box volume of the last frame (in nm^3).
+    """
+
+    def __init__(self, bin_edges, bin_counts, n_frames, n_points, volume):
+        self.bin_edges = np.asarray(bin_edges)
+        self.bin_counts = np.asarray(bin_counts)
+        self.n_frames = n_frames
+        self.rdf = _normalize_counts(
+            self.bin_edges, self.bin_counts, n_frames, n_points, volume
+        )
+        self.rdf_err = None
+
+    @property
+    def bin_centers(self):
+        """The centers of the RDF histogram bins (in nm)."""
+        return (self.bin_edges[1:] + self.bin_edges[:-1]) / 2
+
+
+def _gsd_rdf(
+    gsdfile, frames=10, stride=1, bins=50, r_min=0.5, r_max=None, n_workers=1
+):
+    """Compute the RDF given a GSD file, refer to _trajectory_rdf."""
+    return _trajectory_rdf(
+        gsdfile, frames, stride, bins, r_min, r_max, n_workers
+    )
+
+
+def _trajectory_rdf(
+    filename,
+    frames=10,
+    stride=1,
+    bins=50,
+    r_min=0.5,
+    r_max=None,
+    n_workers=1,
+    top=None,
+    box=None,
+    chunk_size=100,
+):
+    """Compute the RDF given a trajectory of any format read by iter_frames.
+
+    The frames are streamed in chunks of at most chunk_size frames. Serially
+    they are accumulated into a freud.density.RDF. With n_workers > 1 each
+    chunk is submitted to a process pool, keeping at most n_workers chunks in
+    flight, and the partial histograms are summed into a ReducedRDF.
+    top and box are passed to iter_frames for the formats that need them.
+    """
+    n_frames = count_frames(filename, top)
     if r_max is None:
-        with gsd.hoomd.open(gsdfile) as trajectory:
-            box = trajectory[-1].configuration.box[:3]
-        r_max = min(box) * 0.45
+        r_max = min(last_box(filename, top, box)[:3]) * 0.45
+    indices = _frame_indices(n_frames, frames, stride)
+    chunks = iter_frames(
+        filename,
+        start=indices.start,
+        stop=indices.stop,
+        stride=indices.step,
+        chunk_size=chunk_size,
+        top=top,
+        box=box,
+    )
+
+    if n_workers == 1:
+        rdf = freud.density.RDF(bins=bins, r_min=r_min, r_max=r_max)
+        for chunk in chunks:
+            for frame in chunk:
+                rdf.compute((frame.box, frame.positions), reset=False)
+        return rdf
+
+    bin_counts = np.zeros(bins, dtype=np.int64)
+    last = None
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        pending = set()
+        for chunk in chunks:
+            if len(pending) >= n_workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                bin_counts += sum(future.result() for future in done)
+            systems = [(frame.box, frame.positions) for frame in chunk]
+            pending.add(
+                executor.submit(_rdf_bin_counts, systems, bins, r_min, r_max)
+            )
+            last = chunk[-1]
+        bin_counts += sum(future.result() for future in pending)
+
+    bin_edges = freud.density.RDF(bins=bins, r_min=r_min, r_max=r_max).bin_edges
+    return ReducedRDF(
+        bin_edges=bin_edges,
+        bin_counts=bin_counts,
+        n_frames=len(indices),
+        n_points=len(last.positions),
+        volume=freud.box.Box.from_box(last.box).volume,
+    )
 
+
+def _rdf_bin_counts(systems, bins, r_min, r_max):
+    """Accumulate the RDF pair counts of a list of (box, points) systems."""
     rdf = freud.density.RDF(bins=bins, r_min=r_min, r_max=r_max)
+    for system in systems:
+        rdf.compute(system, reset=False)
+    return rdf.bin_counts.astype(np.int64)
+
+
+def _rdf_frame_counts(systems, bins, r_min, r_max):
+    """Return the RDF pair counts of each of a list of (box, points) systems."""
+    rdf = freud.density.RDF(bins=bins, r_min=r_min, r_max=r_max)
+    counts = np.zeros((len(systems), bins), dtype=np.int64)
+    for i, system in enumerate(systems):
+        rdf.compute(system, reset=True)
+        counts[i] = rdf.bin_counts
+    return counts
+
 
+def _normalize_counts(bin_edges, bin_counts, n_frames, n_points, volume):
+    """Normalize summed pair counts into an RDF the way freud does."""
+    shell_volumes = 4 / 3 * np.pi * (bin_edges[1:] ** 3 - bin_edges[:-1] ** 3)
+    number_density = n_points / volume
+    return bin_counts / (n_frames * n_points * number_density * shell_volumes)
+
+
+def _gsd_rdf_per_frame(
+    gsdfile,
+    frames=10,
+    stride=1,
+    bins=50,
+    r_min=0.5,
+    r_max=None,
+    n_workers=1,
+    cache_file=None,
+    n_blocks=None,
+):
+    """Compute the RDF given a GSD file from the pair counts of each frame.
+
+    If cache_file is provided, the pair counts, particle numbers and box
+    volumes of each frame are stored there keyed by frame index (and checked
+    against the frame's fingerprint), so only missing frames are computed. If
+    r_max is None, the r_max stored with them is reused as long as it is
+    less than half the smallest box length of the last frame.
+    """
     with gsd.hoomd.open(gsdfile) as trajectory:
-        start = -(frames * stride) + stride - 1
-        for frame in trajectory[start::stride]:
-            rdf.compute(frame, reset=False)
+        max_r_max = min(trajectory[-1].configuration.box[:3]) / 2
+        cached, r_max = _load_rdf_frames(
+            cache_file, bins, r_min, r_max, max_r_max
+        )
+        indices = list(_frame_indices(len(trajectory), frames, stride))
+        fingerprints = {i: _frame_fingerprint(trajectory, i) for i in indices}
+
+        missing = [
+            i
+            for i in indices
+            if cached["fingerprint"].get(i) != fingerprints[i]
+        ]
+        systems = []
+        for i in missing:
+            frame = trajectory[i]
+            systems.append((frame.configuration.box, frame.particles.position))
 
+    if systems:
+        if n_workers == 1:
+            new_counts = _rdf_frame_counts(systems, bins, r_min, r_max)
+        else:
+            # Contiguous chunks keep the per-frame counts in order.
+            chunks = [
+                list(chunk)
+                for chunk in np.array_split(np.arange(len(systems)), n_workers)
+                if len(chunk)
+            ]
+            with ProcessPoolExecutor(max_workers=len(chunks)) as executor:
+                new_counts = np.concatenate(
+                    list(
+                        executor.map(
+                            _rdf_frame_counts,
+                            [[systems[j] for j in chunk] for chunk in chunks],
+                            [bins] * len(chunks),
+                            [r_min] * len(chunks),
+                            [r_max] * len(chunks),
+                        )
+                    )
+                )
+        for i, (box, points), counts in zip(missing, systems, new_counts):
+            cached["fingerprint"][i] = fingerprints[i]
+            cached["bin_counts"][i] = counts
+            cached["n_points"][i] = len(points)
+            cached["volume"][i] = freud.box.Box.from_box(box).volume
+        if cache_file is not None:
+            _save_rdf_frames(cache_file, cached, bins, r_min, r_max)
+
+    frame_counts = np.array([cached["bin_counts"][i] for i in indices])
+    bin_edges = freud.density.RDF(bins=bins, r_min=r_min, r_max=r_max).bin_edges
+    last = indices[-1]
+    rdf = ReducedRDF(
+        bin_edges=bin_edges,
+        bin_counts=frame_counts.sum(axis=0),
+        n_frames=len(indices),
+        n_points=cached["n_points"][last],
+        volume=cached["volume"][last],
+    )
+    if n_blocks:
+        block_rdfs = [
+            _normalize_counts(
+                bin_edges,
+                block.sum(axis=0),
+                len(block),
+                cached["n_points"][last],
+                cached["volume"][last],
+            )
+            for block in np.array_split(frame_counts, n_blocks)
+        ]
+        rdf.rdf_err = np.std(block_rdfs, axis=0, ddof=1) / np.sqrt(n_blocks)
     return rdf
+
+
+def _frame_fingerprint(trajectory, i):
+    """Return a hash of the timestep, box and positions of a frame.
+
+    The chunks are read directly from the file, a chunk missing from the
+    frame (i.e. taken from the first frame) is hashed by its name.
+    """
+    h = hashlib.sha256()
+    for name in (
+        "configuration/step",
+        "configuration/box",
+        "particles/position",
+    ):
+        if trajectory.file.chunk_exists(frame=i, name=name):
+            h.update(trajectory.file.read_chunk(frame=i, name=name).tobytes())
+        else:
+            h.update(name.encode())
+    return h.hexdigest()
+
+
+def _load_rdf_frames(cache_file, bins, r_min, r_max, max_r_max):
+    """Load the per-frame RDF data stored for the same binning.
+
+    If r_max is None, the stored r_max is used if bins and r_min match and
+    it is below max_r_max (half the smallest box length), otherwise r_max
+    is 0.9 * max_r_max and nothing is loaded.
+
+    Returns
+    -------
+    cached : dict
+        The stored data of each frame, empty if the binning differs.
+    r_max : float
+        The maximum distance of the binning.
+    """
+    cached = {
+        "fingerprint": {},
+        "bin_counts": {},
+        "n_points": {},
+        "volume": {},
+    }
+    binning = None
+    if cache_file is not None and os.path.isfile(cache_file):
+        with np.load(cache_file) as data:
+            if all(key in data.files for key in cached):
+                binning = data["binning"]
+                frame = data["frame"].tolist()
+                stored = {key: data[key] for key in cached}
+    if r_max is None:
+        if (
+            binning is not None
+            and np.allclose(binning[:2], [bins, r_min])
+            and binning[2] < max_r_max
+        ):
+            r_max = float(binning[2])
+        else:
+            r_max = 0.9 * max_r_max
+    if binning is not None and np.allclose(binning, [bins, r_min, r_max]):
+        for key in cached:
+            cached[key] = dict(zip(frame, stored[key]))
+    return cached, r_max
+
+
+def _save_rdf_frames(cache_file, cached, bins, r_min, r_max):
+    """Atomically store the per-frame RDF data."""
+    frame_indices = sorted(cached["fingerprint"])
+    tmp_file = cache_file + ".tmp"
+    with open(tmp_file, "wb") as f:
+        np.savez(
+            f,
+            binning=np.array([bins, r_min, r_max]),
+            frame=np.array(frame_indices, dtype=np.int64),
+            **{
+                key: np.array([values[i] for i in frame_indices])
+                for key, values in cached.items()
+            },
+        )
+    os.replace(tmp_file, cache_file)
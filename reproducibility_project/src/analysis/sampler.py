@@ -1,16 +1,34 @@
 """Use the pymbar package to perform decorrelated equilibration sampling."""
+import hashlib
+import json
 
 import numpy as np
 from pymbar import timeseries
 
 from reproducibility_project.src.analysis.equlibration import is_equilibrated
+from reproducibility_project.src.analysis.thermo_log import read_log_column
 
 
-def sample_job(job, variable="potential_energy", threshold=0.75):
+def sample_job(
+    job,
+    variable="potential_energy",
+    threshold=0.75,
+    nskip=1,
+    filename=None,
+):
     """Use the timeseries module from pymbar to perform statistical sampling.
 
     The start, end and decorrleated step size of the production region are
-    added to the job document.
+    added to the job document. The log is read through the columnar cache of
+    thermo_log.read_log_column.
+
+    The results are memoized in the job document under
+    "sampling_cache"[variable], with one entry per set of parameters (keyed
+    by a hash of threshold and nskip) holding a hash of the sampled data.
+    Rerunning this method on an unchanged log returns the stored results
+    without repeating the analysis, while a grown or modified log
+    invalidates them. Data that is not equilibrated is memoized as well,
+    and the ValueError is raised again from the cache.
 
     Parameters
     ----------
@@ -20,18 +38,55 @@ def sample_job(job, variable="potential_energy", threshold=0.75):
         The variable to be used in sampling.
     threshold : float, optional, default=0.75
         Fraction of data expected to be equilibrated.
+    nskip : int, optional, default=1
+        Stride between the time origins that are tested. Refer to
+        equilibration.is_equilibrated.
+    filename : str, optional, default=None
+        Name of the text or GSD log in the job workspace. If None, "log.gsd"
+        if "hoomd_log_format" is "gsd" in the project document (refer to
+        the HOOMD-blue project), otherwise "log.txt".
     """
+    if filename is None:
+        filename = _log_filename(job)
     try:
         job.doc["sampling_results"]
     except KeyError:
         job.doc["sampling_results"] = {}
+    try:
+        job.doc["sampling_cache"]
+    except KeyError:
+        job.doc["sampling_cache"] = {}
+
+    data = read_log_column(job, variable, filename=filename)
+    params_key = _cache_key(threshold=threshold, nskip=nskip)
+    data_key = _cache_key(data)
+    if variable not in job.doc["sampling_cache"]:
+        job.doc["sampling_cache"][variable] = {}
+    cached = job.doc["sampling_cache"][variable].get(params_key)
+    if cached is None or cached["data"] != data_key:
+        try:
+            cached = _equilibrated_sampling(data, threshold, nskip=nskip)
+            cached["equilibrated"] = True
+        except ValueError as e:
+            cached = {"equilibrated": False, "message": str(e)}
+        cached["data"] = data_key
+        job.doc["sampling_cache"][variable][params_key] = cached
+    if not cached["equilibrated"]:
+        raise ValueError(cached["message"])
+
+    job.doc["sampling_results"][variable] = range(
+        cached["start"], cached["stop"], cached["step"]
+    )
+
 
-    data = np.genfromtxt(job.fn("log.txt"), names=True)[variable]
-    start, stop, step = _decorr_sampling(data, threshold)
-    job.doc["sampling_results"][variable] = range(start, stop, step)
+def _log_filename(job):
+    """Return the name of the log written for a job by the engine projects."""
+    if job._project.doc.get("hoomd_log_format", "txt") == "gsd":
+        return "log.gsd"
+    return "log.txt"
 
 
-def _decorr_sampling(data, threshold):
+def _decorr_sampling(data, threshold, nskip=1):
     """Use the timeseries module from pymbar to perform statistical sampling.
 
     Parameters
@@ -40,20 +95,40 @@ def _decorr_sampling(data, threshold):
         1-D time dependent data to check for equilibration
     threshold : float
         Fraction of data expected to be equilibrated.
+    nskip : int, optional, default=1
+        Stride between the time origins that are tested. Refer to
+        equilibration.is_equilibrated.
     """
-    is_equil, prod_start, ineff = is_equilibrated(data, threshold, nskip=1)
+    result = _equilibrated_sampling(data, threshold, nskip=nskip)
+    return (result["start"], result["stop"], result["step"])
+
+
+def _equilibrated_sampling(data, threshold, nskip=1):
+    """Return t0, g and the decorrelated index range of the production data."""
+    is_equil, prod_start, ineff = is_equilibrated(data, threshold, nskip=nskip)
     if is_equil:
         uncorr_indices = timeseries.subsampleCorrelatedData(
             data[prod_start:], g=ineff, conservative=True
         )
-        return (
-            uncorr_indices.start + prod_start,
-            uncorr_indices.stop + prod_start,
-            uncorr_indices.step,
-        )
+        return {
+            "t0": int(prod_start),
+            "g": float(ineff),
+            "start": int(uncorr_indices.start + prod_start),
+            "stop": int(uncorr_indices.stop + prod_start),
+            "step": int(uncorr_indices.step),
+        }
     else:
         raise ValueError(
             "Property does not have requisite threshold of production data expected."
             "More production data is needed, or the threshold needs to be lowered."
             "See project.src.analysis.equilibration.is_equilibrated for more information."
         )
+
+
+def _cache_key(data=None, **params):
+    """Hash a 1-D array and/or the parameters used to analyze it."""
+    h = hashlib.sha256()
+    if data is not None:
+        h.update(np.ascontiguousarray(data, dtype=np.float64).tobytes())
+    h.update(json.dumps(params, sort_keys=True).encode())
+    return h.hexdigest()
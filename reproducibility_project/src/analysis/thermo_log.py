@@ -0,0 +1,246 @@
+"""Read GSD thermo logs, and text logs through a binary columnar cache."""
+import hashlib
+import io
+import json
+import os
+import shutil
+
+import gsd
+import gsd.fl
+import numpy as np
+
+
+def read_log_column(job, variable, filename="log.txt"):
+    """Return one column of a whitespace delimited or GSD thermo log.
+
+    GSD logs (filename ending in ".gsd") are binary and read directly with
+    read_gsd_log, the remainder of this description applies to text logs.
+
+    The first call parses the whole log once and stores every column as a
+    separate .npy file in the "<filename>.columns" directory of the job
+    workspace. Later calls return read-only memory maps of those files
+    without parsing the log again. When the log has grown, only the appended
+    rows are parsed and added to the cache, and a log that was truncated or
+    rewritten is parsed again from scratch. Repeated headers, written when
+    restarted simulations append to the same log (e.g. `hoomd.write.Table`
+    with an output file opened in mode="a"), are skipped.
+
+    Column names follow the conventions of `np.genfromtxt(..., names=True)`.
+
+    Parameters
+    ----------
+    job : signac.contrib.job.Job
+        The Job object.
+    variable : str
+        Name of the column to read.
+    filename : str, optional, default="log.txt"
+        Name of the log in the job workspace.
+
+    Returns
+    -------
+    numpy.memmap or numpy.ndarray
+        1-D read-only memory map of the column, or array for GSD logs.
+    """
+    if filename.endswith(".gsd"):
+        columns = read_gsd_log(job.fn(filename), variables=[variable])
+        if variable not in columns:
+            raise ValueError(f"Variable {variable} not found in {filename}.")
+        return columns[variable]
+
+    cache_dir = job.fn(f"{filename}.columns")
+    meta = _update_cache(job.fn(filename), cache_dir)
+    if meta["names"] is None or variable not in meta["names"]:
+        raise ValueError(f"Variable {variable} not found in {filename}.")
+    if meta["n_rows"] == 0:
+        return np.empty(0)
+    return np.load(os.path.join(cache_dir, f"{variable}.npy"), mmap_mode="r")
+
+
+def read_gsd_log(filename, variables=None):
+    """Return the scalar quantities of a GSD log as NumPy arrays.
+
+    The log is written by `hoomd.write.GSD` with a logger (e.g. with
+    `filter=hoomd.filter.Null()` to store no particle data). Quantities are
+    named by the last component of their log name, e.g.
+    "log/md/compute/ThermodynamicQuantities/potential_energy" is returned
+    as "potential_energy". The timestep of each frame is returned as
+    "timestep" if it was not logged.
+
+    Parameters
+    ----------
+    filename : str
+        Path to the GSD file.
+    variables : list of str, optional, default=None
+        Names of the quantities to read, None reads all of them.
+
+    Returns
+    -------
+    dict of str: numpy.ndarray
+        1-D array of each quantity, one value per frame.
+    """
+    columns = {}
+    with gsd.fl.open(name=str(filename), mode="r") as f:
+        chunks = {
+            chunk.split("/")[-1]: chunk
+            for chunk in f.find_matching_chunk_names("log/")
+        }
+        chunks.setdefault("timestep", "configuration/step")
+        for name, chunk in chunks.items():
+            if variables is not None and name not in variables:
+                continue
+            values = np.zeros(f.nframes, dtype=np.float64)
+            for i in range(f.nframes):
+                if f.chunk_exists(frame=i, name=chunk):
+                    values[i] = f.read_chunk(frame=i, name=chunk)[0]
+                elif i > 0:
+                    # Unchanged values may be stored in the first frame only
+                    values[i] = values[0]
+            columns[name] = values
+    return columns
+
+
+def _update_cache(log_fn, cache_dir):
+    """Bring the columnar cache of a log up to date and return its metadata."""
+    stat = os.stat(log_fn)
+    meta_fn = os.path.join(cache_dir, "meta.json")
+    meta = None
+    if os.path.isfile(meta_fn):
+        with open(meta_fn, "r") as f:
+            meta = json.load(f)
+        if (
+            stat.st_size == meta["offset"]
+            and stat.st_mtime_ns == meta["mtime_ns"]
+        ):
+            return meta
+        if stat.st_size < meta["offset"] or meta.get(
+            "fingerprint"
+        ) != _log_fingerprint(log_fn, meta["offset"]):
+            # The log was truncated or rewritten, start over.
+            meta = None
+
+    if meta is None:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        os.makedirs(cache_dir)
+        meta = {"offset": 0, "mtime_ns": None, "names": None, "n_rows": 0}
+
+    with open(log_fn, "rb") as f:
+        f.seek(meta["offset"])
+        chunk = f.read()
+    # Leave an incomplete trailing line for the next call.
+    end = chunk.rfind(b"\n") + 1
+    names, rows = _parse_log_lines(chunk[:end].decode(), meta["names"])
+
+    if names is not None and len(rows):
+        for i, name in enumerate(names):
+            _append_npy(
+                os.path.join(cache_dir, f"{name}.npy"),
+                rows[:, i],
+                meta["n_rows"],
+            )
+    meta["offset"] += end
+    meta["fingerprint"] = _log_fingerprint(log_fn, meta["offset"])
+    meta["mtime_ns"] = stat.st_mtime_ns
+    meta["names"] = names
+    meta["n_rows"] += len(rows)
+
+    tmp_fn = meta_fn + ".tmp"
+    with open(tmp_fn, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp_fn, meta_fn)
+    return meta
+
+
+def _log_fingerprint(log_fn, offset, size=4096):
+    """Return a hash of the start of a log and of the bytes before offset.
+
+    A log rewritten from scratch differs from the cached one in these bytes,
+    even if it has grown past the cached offset since.
+    """
+    h = hashlib.sha256()
+    with open(log_fn, "rb") as f:
+        h.update(f.read(min(offset, size)))
+        start = max(0, offset - size)
+        f.seek(start)
+        h.update(f.read(offset - start))
+    return h.hexdigest()
+
+
+# Fixed length of the .npy headers of the cached columns, so that a column is
+# extended in place by appending values and updating the shape in the header.
+_NPY_HEADER_LEN = 128
+
+
+def _npy_header(n_rows):
+    """Return the .npy (version 1.0) header of a 1-D float64 column."""
+    header = (
+        f"{{'descr': '<f8', 'fortran_order': False, 'shape': ({n_rows},), }}"
+    )
+    header = header.ljust(_NPY_HEADER_LEN - 10 - 1) + "\n"
+    return (
+        b"\x93NUMPY\x01\x00"
+        + len(header).to_bytes(2, "little")
+        + (header.encode("latin1"))
+    )
+
+
+def _append_npy(fn, values, n_old):
+    """Append values to the first n_old values of a 1-D .npy file.
+
+    The values are written at the end of the file and only the header is
+    rewritten, so the cost is proportional to the appended values. Values
+    beyond n_old, left by an interrupted update, are overwritten.
+    """
+    values = np.ascontiguousarray(values, dtype="<f8")
+    mode = "r+b" if n_old and os.path.isfile(fn) else "wb"
+    with open(fn, mode) as f:
+        f.seek(_NPY_HEADER_LEN + 8 * n_old)
+        f.truncate()
+        f.write(values.tobytes())
+        f.seek(0)
+        f.write(_npy_header(n_old + len(values)))
+
+
+def _parse_log_lines(text, names=None):
+    """Parse the complete lines of a whitespace delimited log.
+
+    Header lines are recognized by starting with a letter. The first header
+    sets the column names if `names` is None and later (repeated) headers
+    are skipped.
+
+    Returns
+    -------
+    names : list of str or None
+        Column names, None if no header has been seen yet.
+    rows : numpy.ndarray
+        2-D array of shape (n_rows, n_columns).
+    """
+    lines = []
+    for line in text.splitlines():
+        stripped = line.strip()
+        if not stripped:
+            continue
+        if stripped[0].isalpha():
+            header = _header_names(stripped)
+            if names is None:
+                names = header
+            elif header != names:
+                raise ValueError(
+                    f"Log header changed from {names} to {header}."
+                )
+            continue
+        lines.append(stripped)
+
+    if not lines:
+        return names, np.empty((0, len(names) if names else 0))
+    if names is None:
+        raise ValueError("Log rows found before the first header.")
+    rows = np.array(" ".join(lines).split(), dtype=np.float64)
+    return names, rows.reshape(len(lines), -1)
+
+
+def _header_names(line):
+    """Return the column names np.genfromtxt(..., names=True) would use."""
+    dummy = " ".join(["0"] * len(line.split()))
+    return list(
+        np.genfromtxt(io.StringIO(f"{line}\n{dummy}"), names=True).dtype.names
+    )
@@ -0,0 +1,268 @@
+"""Engine-agnostic, streaming access to simulation trajectories."""
+import os
+from collections import namedtuple
+
+import freud
+import gsd
+import gsd.hoomd
+import numpy as np
+
+Frame = namedtuple("Frame", ["positions", "box", "types", "bonds"])
+Frame.__doc__ = """A single trajectory frame in nm.
+
+Attributes
+----------
+positions : numpy.ndarray
+    (N, 3) particle positions (in nm), wrapped into the box.
+box : numpy.ndarray
+    Box in the GSD convention [Lx, Ly, Lz, xy, xz, yz] (lengths in nm).
+types : numpy.ndarray
+    (N,) particle type (or atom) names.
+bonds : numpy.ndarray or None
+    (M, 2) particle indices of the bonds, None if unavailable.
+"""
+
+_MDTRAJ_EXTENSIONS = (".xtc", ".trr", ".dcd", ".nc", ".h5")
+
+
+def iter_frames(
+    filename, start=0, stop=None, stride=1, chunk_size=100, top=None, box=None
+):
+    """Lazily yield the frames of a trajectory in chunks.
+
+    The format is deduced from the file name:
+
+    * ".gsd" (HOOMD-blue), read with gsd. Lengths are expected in nm, as
+      written by the HOOMD-blue project.
+    * ".xtc", ".trr" (GROMACS, LAMMPS) and other formats read by mdtraj,
+      which requires a topology file `top` (e.g. "init.gro").
+    * ".xyz" and MCCCS movie files such as "box1movie1a.xyz.<step>", with
+      lengths in Angstrom. The box is not stored in these files and must be
+      provided with `box`.
+
+    At most `chunk_size` frames are held in memory at a time.
+
+    Parameters
+    ----------
+    filename : str
+        Path to the trajectory file.
+    start : int, default 0
+        Index of the first frame to read.
+    stop : int, default None
+        Index of the frame to stop before, None reads up to the last frame.
+    stride : int, default 1
+        The step size between frames.
+    chunk_size : int, default 100
+        The maximum number of frames per chunk.
+    top : str, default None
+        Topology file for the formats read with mdtraj.
+    box : float or array-like, default None
+        Box length (in nm) of a cubic box, or a box in the GSD convention
+        [Lx, Ly, Lz, xy, xz, yz], for xyz files.
+
+    Yields
+    ------
+    list of Frame
+        The next chunk of frames.
+    """
+    frames = _iter_single_frames(filename, start, stop, stride, top, box)
+    chunk = []
+    for frame in frames:
+        chunk.append(frame)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def count_frames(filename, top=None):
+    """Return the number of frames in a trajectory without loading them.
+
+    Parameters
+    ----------
+    filename : str
+        Path to the trajectory file.
+    top : str, default None
+        Topology file for the formats read with mdtraj.
+    """
+    kind = _trajectory_kind(filename)
+    if kind == "gsd":
+        with gsd.hoomd.open(filename) as trajectory:
+            return len(trajectory)
+    elif kind == "mdtraj":
+        import mdtraj as md
+
+        with md.open(str(filename)) as f:
+            return len(f)
+    else:
+        n_frames = 0
+        with open(filename, "r") as f:
+            for n_particles in _xyz_frame_sizes(f):
+                n_frames += 1
+        return n_frames
+
+
+def last_box(filename, top=None, box=None):
+    """Return the box of the last frame in the GSD convention (in nm).
+
+    Parameters
+    ----------
+    filename : str
+        Path to the trajectory file.
+    top : str, default None
+        Topology file for the formats read with mdtraj.
+    box : float or array-like, default None
+        Box of xyz files, refer to iter_frames.
+    """
+    kind = _trajectory_kind(filename)
+    if kind == "gsd":
+        with gsd.hoomd.open(filename) as trajectory:
+            return np.asarray(trajectory[-1].configuration.box, dtype=float)
+    elif kind == "mdtraj":
+        import mdtraj as md
+
+        n_frames = count_frames(filename, top)
+        traj = md.load_frame(str(filename), n_frames - 1, top=str(top))
+        return _box_from_vectors(traj.unitcell_vectors[0])
+    else:
+        return _as_gsd_box(box)
+
+
+def _trajectory_kind(filename):
+    """Return the reader used for a trajectory file name."""
+    name = os.path.basename(str(filename)).lower()
+    if name.endswith(".gsd"):
+        return "gsd"
+    elif name.endswith(_MDTRAJ_EXTENSIONS):
+        return "mdtraj"
+    elif name.endswith(".xyz") or ".xyz." in name:
+        return "xyz"
+    raise ValueError(f"Unsupported trajectory format: {filename}.")
+
+
+def _iter_single_frames(filename, start, stop, stride, top, box):
+    """Yield the selected frames of a trajectory one at a time."""
+    kind = _trajectory_kind(filename)
+    if kind == "gsd":
+        yield from _iter_gsd(filename, start, stop, stride)
+    elif kind == "mdtraj":
+        yield from _iter_mdtraj(filename, start, stop, stride, top)
+    else:
+        yield from _iter_xyz(filename, start, stop, stride, box)
+
+
+def _iter_gsd(filename, start, stop, stride):
+    """Yield the frames of a GSD file."""
+    with gsd.hoomd.open(filename) as trajectory:
+        for i in range(len(trajectory))[start:stop:stride]:
+            frame = trajectory[i]
+            types = np.asarray(frame.particles.types)
+            if frame.bonds.N:
+                bonds = np.asarray(frame.bonds.group, dtype=int)
+            else:
+                bonds = None
+            yield Frame(
+                positions=np.asarray(frame.particles.position),
+                box=np.asarray(frame.configuration.box, dtype=float),
+                types=types[frame.particles.typeid.astype(int)],
+                bonds=bonds,
+            )
+
+
+def _iter_mdtraj(filename, start, stop, stride, top):
+    """Yield the frames of a trajectory read by mdtraj."""
+    import mdtraj as md
+
+    if top is None:
+        raise ValueError(f"A topology file is required to read {filename}.")
+    selected = range(count_frames(filename, top))[start:stop:stride]
+    if not selected:
+        return
+
+    # The stride is applied here, as the strided readers of some mdtraj
+    # versions do not return the unit cells (or stall) for xtc files.
+    i = selected.start
+    for chunk in md.iterload(str(filename), top=str(top), skip=i):
+        types = np.array([atom.name for atom in chunk.topology.atoms])
+        bonds = np.array(
+            [[a.index, b.index] for a, b in chunk.topology.bonds], dtype=int
+        ).reshape(-1, 2)
+        for xyz, vectors in zip(chunk.xyz, chunk.unitcell_vectors):
+            if i >= selected.stop:
+                return
+            if i in selected:
+                box = _box_from_vectors(vectors)
+                yield Frame(
+                    positions=freud.box.Box.from_box(box).wrap(xyz),
+                    box=box,
+                    types=types,
+                    bonds=bonds if len(bonds) else None,
+                )
+            i += 1
+
+
+def _iter_xyz(filename, start, stop, stride, box):
+    """Yield the frames of a (multi-frame) xyz file in Angstrom."""
+    if box is None:
+        raise ValueError(f"The box is required to read {filename}.")
+    box = _as_gsd_box(box)
+    freud_box = freud.box.Box.from_box(box)
+    # The frames are counted first, so that negative indices select the
+    # same frames as for the other formats.
+    selected = range(count_frames(filename))[start:stop:stride]
+    if not selected:
+        return
+    with open(filename, "r") as f:
+        for i, n_particles in enumerate(_xyz_frame_sizes(f, skip_atoms=False)):
+            lines = [f.readline() for _ in range(n_particles)]
+            if i >= selected.stop:
+                return
+            if i not in selected:
+                continue
+            fields = np.array([line.split()[:4] for line in lines])
+            positions = fields[:, 1:].astype(float) / 10
+            yield Frame(
+                positions=freud_box.wrap(positions),
+                box=box,
+                types=fields[:, 0],
+                bonds=None,
+            )
+
+
+def _xyz_frame_sizes(f, skip_atoms=True):
+    """Yield the number of atoms of each frame of an open xyz file.
+
+    The comment line is consumed. If skip_atoms is False the caller must
+    consume the atom lines before requesting the next frame.
+    """
+    while True:
+        line = f.readline()
+        if not line.strip():
+            return
+        n_particles = int(line)
+        f.readline()
+        yield n_particles
+        if skip_atoms:
+            for _ in range(n_particles):
+                f.readline()
+
+
+def _as_gsd_box(box):
+    """Convert a cubic box length or box array to the GSD convention."""
+    box = np.atleast_1d(np.asarray(box, dtype=float))
+    if box.size == 1:
+        box = np.repeat(box, 3)
+    return _box_array(freud.box.Box.from_box(box))
+
+
+def _box_from_vectors(vectors):
+    """Convert (3, 3) box vectors (one per row) to the GSD convention."""
+    return _box_array(
+        freud.box.Box.from_matrix(np.asarray(vectors, dtype=float).T)
+    )
+
+
+def _box_array(box):
+    """Return a freud box as [Lx, Ly, Lz, xy, xz, yz]."""
+    return np.array([box.Lx, box.Ly, box.Lz, box.xy, box.xz, box.yz])
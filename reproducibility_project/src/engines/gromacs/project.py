@@ -1,4 +1,6 @@
 """Setup for signac, signac-flow, signac-dashboard for this study."""
+import functools
+import json
 import os
 import pathlib
 import sys
@@ -8,7 +10,9 @@ import unyt as u
 from flow import environments
 
 from reproducibility_project.src.engine_input.gromacs import mdp
-from reproducibility_project.src.utils.forcefields import load_ff
+from reproducibility_project.src.utils.forcefields import apply_ff, load_ff
+
+KPA_TO_BAR = (1 * u.kPa).to_value("bar")
 
 
 class Project(flow.FlowProject):
@@ -32,65 +36,102 @@ class Project(flow.FlowProject):
 def init_job(job):
     """Initialize individual job workspace, including mdp and molecular init files."""
     sys.path.append(Project().root_directory() + "/..")
-    from reproducibility_project.src.engine_input.gromacs import mdp
     from reproducibility_project.src.molecules.system_builder import (
         construct_system,
     )
 
     # Create a Compound and save to gro and top files
-    system = construct_system(job.sp)
+    system = construct_system(
+        job.sp,
+        cache_dir=os.path.join(Project().root_directory(), "packed_systems"),
+    )
     system[0].save(filename="init.gro", overwrite=True)
-    ff = load_ff(job.sp.forcefield_name)
-    param_system = ff.apply(system[0])
+    ff = load_ff(
+        job.sp.forcefield_name,
+        cache_dir=os.path.join(Project().root_directory(), "forcefields"),
+    )
+    param_system = apply_ff(
+        ff,
+        system[0],
+        cache_dir=os.path.join(Project().root_directory(), "atomtyping"),
+    )
     param_system.save(
         "init.top",
         overwrite=True,
     )
 
     # Modify mdp files according to job statepoint parameters
+    render_mdps([job])
+
+
+def render_mdps(jobs):
+    """Render the em, nvt and npt mdp files of many jobs in one batch.
+
+    The templates are compiled once per process. A file is only written if
+    its content changed, so the modification times of unchanged mdp files
+    (and the grompp steps depending on them) are preserved, e.g. when all
+    inputs are re-rendered after a template change.
+
+    Parameters
+    ----------
+    jobs : iterable of signac.contrib.job.Job
+        The jobs to render the mdp files for.
+
+    Returns
+    -------
+    list of str
+        The paths of the files that were written.
+    """
+    templates = _mdp_templates()
+    written = []
+    for job in jobs:
+        for op, data in _mdp_data(job.sp).items():
+            fname = job.fn(f"{op}.mdp")
+            if _setup_mdp(
+                fname=fname, template=templates[op], data=data, overwrite=True
+            ):
+                written.append(fname)
+    return written
+
+
+@functools.lru_cache(maxsize=None)
+def _mdp_templates():
+    """Return the compiled em, nvt and npt templates."""
+    from jinja2 import Environment, FileSystemLoader
+
+    env = Environment(
+        loader=FileSystemLoader(os.path.dirname(os.path.abspath(mdp.__file__)))
+    )
+    return {
+        op: env.get_template(f"{op}_template.mdp.jinja")
+        for op in ["em", "nvt", "npt"]
+    }
+
+
+def _mdp_data(sp):
+    """Return the template data of the em, nvt and npt mdp files."""
     cutoff_styles = {"hard": "Cut-off"}
-    pressure = job.sp.pressure * u.kPa
-    mdp_abs_path = os.path.dirname(os.path.abspath(mdp.__file__))
-    mdps = {
+    cutoff_style = cutoff_styles[sp["cutoff_style"]]
+    return {
         "em": {
-            "fname": "em.mdp",
-            "template": f"{mdp_abs_path}/em_template.mdp.jinja",
-            "data": {
-                "r_cut": job.sp.r_cut,
-                "cutoff_style": cutoff_styles[job.sp.cutoff_style],
-                "temp": job.sp.temperature,
-                "replica": job.sp.replica,
-            },
+            "r_cut": sp["r_cut"],
+            "cutoff_style": cutoff_style,
+            "temp": sp["temperature"],
+            "replica": sp["replica"],
         },
         "nvt": {
-            "fname": "nvt.mdp",
-            "template": f"{mdp_abs_path}/nvt_template.mdp.jinja",
-            "data": {
-                "temp": job.sp.temperature,
-                "r_cut": job.sp.r_cut,
-                "cutoff_style": cutoff_styles[job.sp.cutoff_style],
-            },
+            "temp": sp["temperature"],
+            "r_cut": sp["r_cut"],
+            "cutoff_style": cutoff_style,
         },
         "npt": {
-            "fname": "npt.mdp",
-            "template": f"{mdp_abs_path}/npt_template.mdp.jinja",
-            "data": {
-                "temp": job.sp.temperature,
-                "refp": pressure.to_value("bar"),
-                "r_cut": job.sp.r_cut,
-                "cutoff_style": cutoff_styles[job.sp.cutoff_style],
-            },
+            "temp": sp["temperature"],
+            "refp": sp["pressure"] * KPA_TO_BAR,
+            "r_cut": sp["r_cut"],
+            "cutoff_style": cutoff_style,
         },
     }
 
-    for op, mdp in mdps.items():
-        _setup_mdp(
-            fname=mdp["fname"],
-            template=mdp["template"],
-            data=mdp["data"],
-            overwrite=True,
-        )
-
 
 @Project.operation
 @Project.pre(lambda j: j.sp.engine == "gromacs")
@@ -109,12 +150,14 @@ def grompp_em(job):
 @Project.operation
 @Project.pre(lambda j: j.sp.engine == "gromacs")
 @Project.pre(lambda j: j.isfile("em.tpr"))
+@Project.pre(lambda j: not _multidir())
+@Project.pre(lambda j: _mdrun_settings(j) is not None)
 @Project.post(lambda j: j.isfile("em.gro"))
 @flow.with_job
 @flow.cmd
 def gmx_em(job):
     """Run GROMACS mdrun for the energy minimization step."""
-    return _mdrun_str("em")
+    return _mdrun_str("em", _mdrun_settings(job))
 
 
 @Project.operation
@@ -133,12 +176,14 @@ def grompp_nvt(job):
 @Project.operation
 @Project.pre(lambda j: j.sp.engine == "gromacs")
 @Project.pre(lambda j: j.isfile("nvt.tpr"))
+@Project.pre(lambda j: not _multidir())
+@Project.pre(lambda j: _mdrun_settings(j) is not None)
 @Project.post(lambda j: j.isfile("nvt.gro"))
 @flow.with_job
 @flow.cmd
 def gmx_nvt(job):
     """Run GROMACS mdrun for the nvt step."""
-    return _mdrun_str("nvt")
+    return _mdrun_str("nvt", _mdrun_settings(job))
 
 
 @Project.operation
@@ -157,17 +202,225 @@ def grompp_npt(job):
 @Project.operation
 @Project.pre(lambda j: j.sp.engine == "gromacs")
 @Project.pre(lambda j: j.isfile("npt.tpr"))
+@Project.pre(lambda j: not _multidir())
+@Project.pre(lambda j: _mdrun_settings(j) is not None)
 @Project.post(lambda j: j.isfile("npt.gro"))
 @flow.with_job
 @flow.cmd
 def gmx_npt(job):
     """Run GROMACS mdrun for the npt step."""
-    return _mdrun_str("npt")
+    return _mdrun_str("npt", _mdrun_settings(job))
+
+
+# Bundled alternatives to gmx_em, gmx_nvt and gmx_npt. The replicas of a
+# statepoint that are ready for the same step run as a single
+# `mdrun -multidir` invocation, one MPI rank per replica, which keeps a node
+# busy with the small systems of this study. Each operation groups the
+# replicas by whether they are ready for its step, so replicas that are
+# already done or still blocked do not hold back the others. They replace
+# the single job operations when "gmx_multidir" is true in the project
+# document (set with `Project().doc.gmx_multidir = True`), so the two never
+# run mdrun in the same workspace. Requires an MPI build of GROMACS, the executables are
+# taken from the GMX_MPI (default gmx_mpi) and MPIRUN (default mpirun)
+# environment variables.
+def _replica_groups(op):
+    """Return an aggregator grouping the replicas ready for the step op."""
+    return flow.aggregator.groupby(
+        key=lambda job: _replica_group_key(job, op), sort_by="replica"
+    )
+
+
+@_replica_groups("em")
+@Project.operation.with_directives({"np": lambda *jobs: len(jobs)})
+@Project.pre(lambda *jobs: all(j.sp.engine == "gromacs" for j in jobs))
+@Project.pre(lambda *jobs: all(j.isfile("em.tpr") for j in jobs))
+@Project.pre(lambda *jobs: _multidir())
+@Project.post(lambda *jobs: all(j.isfile("em.gro") for j in jobs))
+@flow.cmd
+def gmx_em_multidir(*jobs):
+    """Run GROMACS mdrun for the energy minimization step of many replicas."""
+    return _mdrun_multidir_str("em", jobs)
+
+
+@_replica_groups("nvt")
+@Project.operation.with_directives({"np": lambda *jobs: len(jobs)})
+@Project.pre(lambda *jobs: all(j.sp.engine == "gromacs" for j in jobs))
+@Project.pre(lambda *jobs: all(j.isfile("nvt.tpr") for j in jobs))
+@Project.pre(lambda *jobs: _multidir())
+@Project.post(lambda *jobs: all(j.isfile("nvt.gro") for j in jobs))
+@flow.cmd
+def gmx_nvt_multidir(*jobs):
+    """Run GROMACS mdrun for the nvt step of many replicas."""
+    return _mdrun_multidir_str("nvt", jobs)
+
+
+@_replica_groups("npt")
+@Project.operation.with_directives({"np": lambda *jobs: len(jobs)})
+@Project.pre(lambda *jobs: all(j.sp.engine == "gromacs" for j in jobs))
+@Project.pre(lambda *jobs: all(j.isfile("npt.tpr") for j in jobs))
+@Project.pre(lambda *jobs: _multidir())
+@Project.post(lambda *jobs: all(j.isfile("npt.gro") for j in jobs))
+@flow.cmd
+def gmx_npt_multidir(*jobs):
+    """Run GROMACS mdrun for the npt step of many replicas."""
+    return _mdrun_multidir_str("npt", jobs)
+
 
+@functools.lru_cache(maxsize=None)
+def _project():
+    """Return the Project, constructed once per process."""
+    return Project()
 
-def _mdrun_str(op):
-    """Output an mdrun string for arbitrary operation."""
+
+def _multidir():
+    """Return whether mdrun runs bundled with -multidir (gmx_multidir)."""
+    return bool(_project().doc.get("gmx_multidir", False))
+
+
+def _replica_group_key(job, op):
+    """Return a key shared by the jobs that only differ in their replica.
+
+    The jobs ready for the step op (its tpr file exists but not its gro
+    file) are grouped apart from the others.
+    """
+    key = {k: v for k, v in job.sp().items() if k != "replica"}
+    key["ready"] = job.isfile(f"{op}.tpr") and not job.isfile(f"{op}.gro")
+    return json.dumps(key, sort_keys=True)
+
+
+def _mdrun_multidir_str(op, jobs):
+    """Output an mdrun -multidir string running op in every job workspace."""
+    dirs = " ".join(job.ws for job in jobs)
+    mpirun = os.environ.get("MPIRUN", "mpirun")
+    gmx_mpi = os.environ.get("GMX_MPI", "gmx_mpi")
+    msg = (
+        f"{mpirun} -np {len(jobs)} {gmx_mpi} mdrun -v -deffnm {op} "
+        f"-s {op}.tpr -cpi {op}.cpt -multidir {dirs}"
+    )
+    return msg
+
+
+@Project.operation
+@Project.pre(lambda j: j.sp.engine == "gromacs")
+@Project.pre(lambda j: j.id == _tuning_job_id(j.sp.molecule))
+@Project.pre(lambda j: j.isfile("init.gro"))
+@Project.pre(lambda j: j.isfile("init.top"))
+@Project.pre(lambda j: j.isfile("nvt.mdp"))
+@Project.post(
+    lambda j: j.sp.molecule in _project().doc.get("mdrun_settings", {})
+)
+@flow.with_job
+def tune_mdrun(job):
+    """Benchmark mdrun settings on one job per molecule.
+
+    Short trial runs of the nvt step, started from the input of the energy
+    minimization (init.gro), are timed over a grid of -ntmpi/-ntomp splits
+    of the cores this process may run on and -nstlist values. The fastest
+    settings and their ns/day are stored in the project document under
+    "mdrun_settings", keyed by molecule, and are used by _mdrun_str for all
+    jobs of that molecule. The mdrun operations wait for these settings.
+    """
+    import subprocess
+
+    subprocess.run(
+        "gmx grompp -f nvt.mdp -o tune.tpr -po tune.mdout.mdp -c init.gro "
+        "-p init.top --maxwarn 1",
+        shell=True,
+        check=True,
+        capture_output=True,
+    )
+    n_cores = len(os.sched_getaffinity(0))
+    best = None
+    for ntmpi in [n for n in [1, 2, 4, 8] if n_cores % n == 0]:
+        for nstlist in [10, 20, 40, 80]:
+            settings = {
+                "ntmpi": ntmpi,
+                "ntomp": n_cores // ntmpi,
+                "nstlist": nstlist,
+            }
+            flags = " ".join(f"-{k} {v}" for k, v in settings.items())
+            result = subprocess.run(
+                f"gmx mdrun -s tune.tpr -deffnm tune_run -nsteps 5000 "
+                f"-resethway -noconfout {flags}",
+                shell=True,
+                capture_output=True,
+            )
+            ns_per_day = (
+                _parse_ns_per_day("tune_run.log")
+                if result.returncode == 0
+                else None
+            )
+            if ns_per_day and (best is None or ns_per_day > best["ns_per_day"]):
+                best = dict(settings, ns_per_day=ns_per_day)
+            for fname in os.listdir("."):
+                if fname.startswith("tune_run."):
+                    os.remove(fname)
+    for fname in ["tune.tpr", "tune.mdout.mdp"]:
+        os.remove(fname)
+    if best is None:
+        raise RuntimeError("No mdrun trial run succeeded.")
+
+    doc = _project().doc
+    if "mdrun_settings" not in doc:
+        doc["mdrun_settings"] = {}
+    doc["mdrun_settings"][job.sp.molecule] = best
+
+
+@functools.lru_cache(maxsize=None)
+def _tuning_job_id(molecule):
+    """Return the id of the job tune_mdrun runs on for a molecule."""
+    return min(
+        job.id
+        for job in _project().find_jobs(
+            {"engine": "gromacs", "molecule": molecule}
+        )
+    )
+
+
+@Project.operation
+@Project.pre(lambda j: j.sp.engine == "gromacs")
+@Project.pre(lambda j: j.isfile("npt.log"))
+@Project.pre(lambda j: j.isfile("npt.gro"))
+@Project.post(lambda j: "npt" in j.doc.get("ns_per_day", {}))
+def record_performance(job):
+    """Store the ns/day of the nvt and npt runs in the job document."""
+    ns_per_day = {}
+    for op in ["nvt", "npt"]:
+        if job.isfile(f"{op}.log"):
+            ns_per_day[op] = _parse_ns_per_day(job.fn(f"{op}.log"))
+    job.doc["ns_per_day"] = ns_per_day
+
+
+def _parse_ns_per_day(log_fn):
+    """Return the ns/day reported at the end of an mdrun log, None if absent."""
+    ns_per_day = None
+    with open(log_fn, "r") as f:
+        for line in f:
+            if line.startswith("Performance:"):
+                ns_per_day = float(line.split()[1])
+    return ns_per_day
+
+
+def _mdrun_settings(job):
+    """Return the mdrun settings tuned for the molecule of job.
+
+    None until tune_mdrun ran for the molecule, the gmx_em, gmx_nvt and
+    gmx_npt operations wait for it.
+    """
+    return _project().doc.get("mdrun_settings", {}).get(job.sp.molecule)
+
+
+def _mdrun_str(op, settings=None):
+    """Output an mdrun string for arbitrary operation.
+
+    The tuned mdrun `settings` (see tune_mdrun), if any, are added to the
+    command.
+    """
     msg = f"gmx mdrun -v -deffnm {op} -s {op}.tpr -cpi {op}.cpt "
+    if settings:
+        msg += " ".join(
+            f"-{k} {settings[k]}" for k in ["ntmpi", "ntomp", "nstlist"]
+        )
     return msg
 
 
@@ -187,7 +440,9 @@ def _setup_mdp(fname, template, data, overwrite=False):
 
     Returns
     -------
-    File saved with names defined by fname
+    bool
+        Whether the file was written, False if it already had the rendered
+        content.
     """
     from jinja2 import Template
 
@@ -202,10 +457,14 @@ def _setup_mdp(fname, template, data, overwrite=False):
             )
 
     rendered = template.render(data)
+    if os.path.isfile(fname):
+        with open(fname, "r") as f:
+            if f.read() == rendered:
+                return False
     with open(fname, "w") as f:
         f.write(rendered)
 
-    return None
+    return True
 
 
 if __name__ == "__main__":
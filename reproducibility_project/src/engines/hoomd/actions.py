@@ -0,0 +1,121 @@
+"""Custom HOOMD-blue actions used by the HOOMD-blue project."""
+import os
+
+import hoomd
+import numpy as np
+
+from reproducibility_project.src.analysis.equlibration import (
+    is_equilibrated_multi,
+)
+
+
+class DecorrelationMonitor(hoomd.custom.Action):
+    """Buffer thermodynamic quantities and count their uncorrelated samples.
+
+    Each time the action is triggered, the quantities are read from a
+    `hoomd.md.compute.ThermodynamicQuantities` compute and appended to an
+    in-memory buffer. Every `check_period` samples, the start of the
+    production region and the statistical inefficiencies are computed with
+    equilibration.is_equilibrated_multi. The number of uncorrelated samples
+    is the length of the production region divided by the largest
+    statistical inefficiency, and `done` is set once all quantities are
+    equilibrated and this number reaches `n_samples`. Quantities that are
+    constant over the production region, or a statistical inefficiency that
+    is not a positive finite number, count as not decorrelated.
+
+    Parameters
+    ----------
+    thermo : hoomd.md.compute.ThermodynamicQuantities
+        The compute providing the quantities.
+    quantities : sequence of str, default ("potential_energy",)
+        Names of the quantities to check.
+    n_samples : int, default 100
+        Target number of uncorrelated samples.
+    threshold : float, optional, default=0.75
+        Fraction of data expected to be equilibrated.
+    check_period : int, default 20
+        Number of new samples between two analyses of the buffer.
+    """
+
+    def __init__(
+        self,
+        thermo,
+        quantities=("potential_energy",),
+        n_samples=100,
+        threshold=0.75,
+        check_period=20,
+    ):
+        super().__init__()
+        self.thermo = thermo
+        self.quantities = list(quantities)
+        self.n_samples = n_samples
+        self.threshold = threshold
+        self.check_period = check_period
+        self.timesteps = []
+        self.data = []
+        self.equilibrated = False
+        self.t0 = None
+        self.n_uncorrelated = 0
+
+    @property
+    def done(self):
+        """bool: Whether the target number of samples is reached."""
+        return self.equilibrated and self.n_uncorrelated >= self.n_samples
+
+    def act(self, timestep):
+        """Buffer the quantities and analyze the buffer periodically."""
+        self.timesteps.append(timestep)
+        self.data.append([getattr(self.thermo, q) for q in self.quantities])
+        if len(self.data) % self.check_period == 0:
+            self.check()
+
+    def check(self):
+        """Update the equilibration state from the buffered samples."""
+        data = np.asarray(self.data, dtype=np.float64)
+        results, t0 = is_equilibrated_multi(
+            data, threshold=self.threshold, search="adaptive"
+        )
+        g = max(result[2] for result in results.values())
+        self.t0 = t0
+        if (
+            not np.isfinite(g)
+            or g <= 0
+            or np.any(np.ptp(data[t0:], axis=0) == 0)
+        ):
+            self.equilibrated = False
+            self.n_uncorrelated = 0
+            return
+        self.equilibrated = all(result[0] for result in results.values())
+        self.n_uncorrelated = int((len(data) - t0) / g)
+
+    def save(self, filename):
+        """Atomically write the buffer to a .npz file."""
+        tmp = f"{filename}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(
+                f,
+                quantities=self.quantities,
+                timesteps=np.asarray(self.timesteps, dtype=np.int64),
+                data=np.asarray(self.data, dtype=np.float64).reshape(
+                    -1, len(self.quantities)
+                ),
+            )
+        os.replace(tmp, filename)
+
+    def load(self, filename, timestep):
+        """Restore the samples of a buffer saved with save.
+
+        Only the samples taken up to `timestep`, e.g. the timestep of a
+        restart file, are restored.
+        """
+        with np.load(filename) as f:
+            if list(f["quantities"]) != self.quantities:
+                raise ValueError(
+                    f"Buffer of {list(f['quantities'])} can not be loaded "
+                    f"to monitor {self.quantities}."
+                )
+            keep = f["timesteps"] <= timestep
+            self.timesteps = f["timesteps"][keep].tolist()
+            self.data = f["data"][keep].tolist()
+        if len(self.data) >= self.check_period:
+            self.check()
@@ -1,12 +1,42 @@
 """Setup for signac, signac-flow, signac-dashboard for this study."""
+import hashlib
+import json
 import os
 import pathlib
+import pickle
+import shutil
+import time
+import warnings
 
 import flow
 from flow import FlowProject
 from flow.environment import DefaultSlurmEnvironment
 
-from reproducibility_project.src.utils.forcefields import load_ff
+from reproducibility_project.src.utils.forcefields import (
+    _ff_path,
+    apply_ff,
+    load_ff,
+)
+
+# The system is either packed in a box 5 times larger and shrunk over
+# SHRINK_STEPS ("shrink"), or packed at the target density and relaxed with
+# at most FIRE_STEPS steps of FIRE energy minimization ("fire").
+_INITS = ("shrink", "fire")
+# The molecules are packed with packmol (mb.fill_box) or, if "lattice", on a
+# lattice, refer to construct_system.
+_PACKINGS = ("packmol", "lattice")
+SHRINK_STEPS = int(2e4) + 1
+FIRE_STEPS = int(1e4)
+# The production runs for PRODUCTION_STEPS ("fixed"), or until
+# N_UNCORRELATED_SAMPLES uncorrelated samples of the potential energy are
+# collected, for at most MAX_PRODUCTION_STEPS ("adaptive").
+_PRODUCTIONS = ("fixed", "adaptive")
+PRODUCTION_STEPS = int(1e6)
+MAX_PRODUCTION_STEPS = int(1e7)
+N_UNCORRELATED_SAMPLES = 100
+LOG_PERIOD = 5000
+# Steps between writes of the restart file and checks of the decorrelation
+RESTART_PERIOD = int(1e5)
 
 
 class Project(FlowProject):
@@ -43,47 +73,78 @@ class Fry(DefaultSlurmEnvironment):
 @Project.pre(lambda j: j.sp.engine == "hoomd")
 @Project.post(lambda j: j.doc.get("finished"))
 def run_hoomd(job):
-    """Run a simulation with HOOMD-blue."""
-    import foyer
+    """Run a simulation with HOOMD-blue.
+
+    The initialization is chosen with "hoomd_init" in the project
+    document, "shrink" (default) or "fire", and the packing of the
+    molecules with "hoomd_packing", "packmol" (default) or "lattice". The
+    time taken to build (or load from the cache) the system and the time
+    taken to relax it are stored under "setup_time"[init] in the job
+    document as "system" and "relax".
+    The FIRE steps are not logged. The production is chosen with
+    "hoomd_production" in the project document, "fixed" (default) runs
+    PRODUCTION_STEPS steps, "adaptive" stops once the potential energy is
+    decorrelated enough. The decorrelation of the potential energy is
+    stored under "production" in the job document, with "t0" in timesteps
+    since the start of the production.
+    """
     import hoomd
     import hoomd.md
     import unyt as u
-    from mbuild.formats.gsdwriter import write_gsd
-    from mbuild.formats.hoomd_forcefield import create_hoomd_forcefield
 
-    from reproducibility_project.src.molecules.system_builder import (
-        construct_system,
+    from reproducibility_project.src.engines.hoomd.actions import (
+        DecorrelationMonitor,
     )
 
-    # temporary hack until benzene and ethanol are added
-    try:
-        # Ignore the vapor box
-        # Initialize with box expanded by factor of 5
-        # We will shrink it later
-        filled_box, _ = construct_system(job.sp, scale=5)
-    except AttributeError:
+    init = Project().doc.get("hoomd_init", "shrink")
+    if init not in _INITS:
+        raise ValueError(
+            f"Passed 'hoomd_init' value: {init}, expected one of {_INITS}."
+        )
+    packing = Project().doc.get("hoomd_packing", "packmol")
+    if packing not in _PACKINGS:
+        raise ValueError(
+            f"Passed 'hoomd_packing' value: {packing}, expected one of "
+            f"{_PACKINGS}."
+        )
+    production = Project().doc.get("hoomd_production", "fixed")
+    if production not in _PRODUCTIONS:
+        raise ValueError(
+            f"Passed 'hoomd_production' value: {production}, expected one of "
+            f"{_PRODUCTIONS}."
+        )
+    system_start = time.time()
+    if init == "shrink":
+        system = _hoomd_system(job, scale=5, packing=packing)
+    else:
+        # With packmol, the packing of the GROMACS project, shared through
+        # the packed_systems cache of construct_system.
+        system = _hoomd_system(job, scale=1.0, packing=packing)
+    if system is None:
         return
+    system_fn, forcefield = system
+    relax_start = time.time()
 
-    ff = load_ff(job.sp.forcefield_name)
-    structure = ff.apply(filled_box)
-
-    # ref_distance: 10 angstrom -> 1 nm
-    # ref_energy: 1/4.184 kcal/mol -> 1 kJ/mol
-    # ref_mass: 0.9999938574 dalton -> 1 amu
-    d = 10
-    e = 1 / 4.184
-    m = 0.9999938574
-    write_gsd(
-        structure, job.fn("init.gsd"), ref_distance=d, ref_energy=e, ref_mass=m
-    )
-
-    snapshot, forcefield, ref_vals = create_hoomd_forcefield(
-        structure, ref_distance=d, ref_energy=e, ref_mass=m
-    )
-
+    # The restart file is only written once the box is compressed, resume
+    # from it (and from the thermostat written with it) and discard the
+    # output written after it. Otherwise start over.
+    restart = job.isfile("restart.gsd")
     device = hoomd.device.auto_select()
     sim = hoomd.Simulation(device=device, seed=job.sp.replica)
-    sim.create_state_from_snapshot(snapshot)
+    if restart:
+        sim.create_state_from_gsd(job.fn("restart.gsd"))
+        _truncate_log(job.fn("log.txt"), sim.timestep)
+        _truncate_gsd(job.fn("log.gsd"), sim.timestep)
+        _truncate_gsd(job.fn("trajectory.gsd"), sim.timestep)
+    else:
+        shutil.copyfile(system_fn, job.fn("init.gsd"))
+        sim.create_state_from_gsd(system_fn)
+        for fn in ("log.txt", "log.gsd", "trajectory.gsd", "monitor.npz"):
+            if job.isfile(fn):
+                os.remove(job.fn(fn))
+        if init == "fire":
+            # Before the writers are attached, the FIRE steps are not logged.
+            _minimize_fire(sim, forcefield)
     gsd_writer = hoomd.write.GSD(
         filename=job.fn("trajectory.gsd"),
         trigger=hoomd.trigger.Periodic(10000),
@@ -107,14 +168,27 @@ def run_hoomd(job):
             "volume",
         ],
     )
-    file = open(job.fn("log.txt"), mode="a", newline="\n")
-    table_file = hoomd.write.Table(
-        output=file,
-        trigger=hoomd.trigger.Periodic(period=5000),
-        logger=logger,
-        max_header_len=7,
-    )
-    sim.operations.writers.append(table_file)
+    # Log to a binary GSD file (read with analysis.read_gsd_log) if
+    # "hoomd_log_format" is "gsd" in the project document, otherwise to a
+    # text table.
+    if Project().doc.get("hoomd_log_format", "txt") == "gsd":
+        file = None
+        log_writer = hoomd.write.GSD(
+            filename=job.fn("log.gsd"),
+            trigger=hoomd.trigger.Periodic(LOG_PERIOD),
+            mode="ab",
+            filter=hoomd.filter.Null(),
+            log=logger,
+        )
+    else:
+        file = open(job.fn("log.txt"), mode="a", newline="\n")
+        log_writer = hoomd.write.Table(
+            output=file,
+            trigger=hoomd.trigger.Periodic(period=LOG_PERIOD),
+            logger=logger,
+            max_header_len=7,
+        )
+    sim.operations.writers.append(log_writer)
 
     integrator = hoomd.md.Integrator(dt=0.005)
     integrator.forces = forcefield
@@ -123,29 +197,345 @@ def run_hoomd(job):
     nvt = hoomd.md.methods.NVT(filter=hoomd.filter.All(), kT=kT, tau=1.0)
     integrator.methods = [nvt]
     sim.operations.integrator = integrator
-    sim.state.thermalize_particle_momenta(filter=hoomd.filter.All(), kT=kT)
-
-    # Shrink step follows this example
-    # https://hoomd-blue.readthedocs.io/en/latest/tutorial/
-    # 01-Introducing-Molecular-Dynamics/03-Compressing-the-System.html
-    ramp = hoomd.variant.Ramp(A=0, B=1, t_start=sim.timestep, t_ramp=int(2e4))
-    initial_box = sim.state.box
-    L = job.sp.box_L_liq
-    final_box = hoomd.Box(Lx=L, Ly=L, Lz=L)
-    box_resize_trigger = hoomd.trigger.Periodic(10)
-    box_resize = hoomd.update.BoxResize(
-        box1=initial_box,
-        box2=final_box,
-        variant=ramp,
-        trigger=box_resize_trigger,
+    if restart and not _read_thermostat(
+        job.fn("restart.gsd"), sim.timestep, nvt
+    ):
+        warnings.warn(
+            f"No thermostat state at timestep {sim.timestep} in the restart "
+            f"of job {job.id}, the resumed run does not continue the "
+            "original trajectory exactly."
+        )
+
+    if not restart:
+        sim.state.thermalize_particle_momenta(filter=hoomd.filter.All(), kT=kT)
+
+        if init == "shrink":
+            # Shrink step follows this example
+            # https://hoomd-blue.readthedocs.io/en/latest/tutorial/
+            # 01-Introducing-Molecular-Dynamics/03-Compressing-the-System.html
+            ramp = hoomd.variant.Ramp(
+                A=0, B=1, t_start=sim.timestep, t_ramp=int(2e4)
+            )
+            initial_box = sim.state.box
+            L = job.sp.box_L_liq
+            final_box = hoomd.Box(Lx=L, Ly=L, Lz=L)
+            box_resize_trigger = hoomd.trigger.Periodic(10)
+            box_resize = hoomd.update.BoxResize(
+                box1=initial_box,
+                box2=final_box,
+                variant=ramp,
+                trigger=box_resize_trigger,
+            )
+            sim.operations.updaters.append(box_resize)
+            sim.run(SHRINK_STEPS)
+            assert sim.state.box == final_box
+            sim.operations.updaters.remove(box_resize)
+        _write_restart(sim, job.fn("restart.gsd"), file, nvt)
+        job.doc.production_start = sim.timestep
+        job.doc.setdefault("setup_time", {})
+        job.doc["setup_time"][init] = {
+            "system": relax_start - system_start,
+            "relax": time.time() - relax_start,
+        }
+
+    # Buffer the production data to follow its decorrelation, and to stop
+    # once it is decorrelated enough for an adaptive production.
+    monitor = DecorrelationMonitor(
+        thermo_props,
+        n_samples=N_UNCORRELATED_SAMPLES,
+        check_period=RESTART_PERIOD // LOG_PERIOD,
+    )
+    if job.isfile("monitor.npz"):
+        monitor.load(job.fn("monitor.npz"), sim.timestep)
+    sim.operations.writers.append(
+        hoomd.write.CustomWriter(
+            action=monitor, trigger=hoomd.trigger.Periodic(LOG_PERIOD)
+        )
+    )
+
+    # Run the production in chunks of RESTART_PERIOD steps, writing the
+    # restart file after each chunk, and exit cleanly when the next chunk
+    # would not finish before HOOMD_WALLTIME_STOP (seconds since the epoch).
+    walltime_stop = os.environ.get("HOOMD_WALLTIME_STOP")
+    production_start = job.doc.get("production_start", SHRINK_STEPS)
+    adaptive = production == "adaptive"
+    if adaptive:
+        last_step = production_start + MAX_PRODUCTION_STEPS
+    else:
+        last_step = production_start + PRODUCTION_STEPS
+    while sim.timestep < last_step and not (adaptive and monitor.done):
+        start = time.time()
+        sim.run(min(RESTART_PERIOD, last_step - sim.timestep))
+        monitor.save(job.fn("monitor.npz"))
+        _write_restart(sim, job.fn("restart.gsd"), file, nvt)
+        chunk_time = time.time() - start
+        if (
+            walltime_stop is not None
+            and sim.timestep < last_step
+            and not (adaptive and monitor.done)
+            and time.time() + chunk_time > float(walltime_stop)
+        ):
+            break
+    else:
+        job.doc.production = {
+            "decorrelated": monitor.done,
+            "n_uncorrelated": monitor.n_uncorrelated,
+            "t0": (
+                None if monitor.t0 is None else int(monitor.t0) * LOG_PERIOD
+            ),
+            "steps": sim.timestep - production_start,
+        }
+        job.doc.finished = True
+    if file is not None:
+        file.close()
+
+
+def _hoomd_system(job, scale, packing):
+    """Return the initial system and forces shared by the replicas of a job.
+
+    Replicas differ only in the seed of the simulation, so the system is
+    built, parameterized and converted to HOOMD-blue units once per
+    statepoint without the replica. The initial state is stored as a GSD
+    file and the forces are pickled in the "hoomd_systems" directory of the
+    project, where the other replicas load them from. Editing the
+    forcefield XML or the file the molecule is built from invalidates them.
+
+    Parameters
+    ----------
+    job : signac.contrib.job.Job
+        The Job object.
+    scale : float
+        Scale factor of the box the molecules are packed in.
+    packing : str
+        Packing method of construct_system, "packmol" or "lattice".
+
+    Returns
+    -------
+    (system_fn, forcefield) : tuple or None
+        Path of the GSD file of the initial state and the forces
+        (list of hoomd.md.force.Force) of the system, or None if the
+        molecule can not be built yet.
+    """
+    import hoomd
+    from mbuild.formats.hoomd_forcefield import create_hoomd_forcefield
+
+    from reproducibility_project.src.molecules.system_builder import (
+        _molecule_source,
+        construct_system,
     )
-    sim.operations.updaters.append(box_resize)
-    sim.run(2e4 + 1)
-    assert sim.state.box == final_box
-    sim.operations.updaters.remove(box_resize)
 
-    sim.run(1e6)
-    job.doc.finished = True
+    sources = {}
+    for fn in (
+        _ff_path(job.sp.forcefield_name),
+        _molecule_source(job.sp.molecule),
+    ):
+        try:
+            sources[fn] = os.stat(fn).st_mtime_ns
+        except OSError:
+            sources[fn] = None
+    key = json.dumps(
+        {
+            "sp": {k: v for k, v in job.sp().items() if k != "replica"},
+            "scale": scale,
+            "packing": packing,
+            "hoomd": hoomd.version.version,
+            "sources": sources,
+        },
+        sort_keys=True,
+    )
+    cache_dir = os.path.join(Project().root_directory(), "hoomd_systems")
+    name = hashlib.sha256(key.encode()).hexdigest()
+    system_fn = os.path.join(cache_dir, f"{name}.gsd")
+    forcefield_fn = os.path.join(cache_dir, f"{name}.pkl")
+    if os.path.isfile(system_fn) and os.path.isfile(forcefield_fn):
+        try:
+            with open(forcefield_fn, "rb") as f:
+                return system_fn, pickle.load(f)
+        except (OSError, pickle.UnpicklingError, AttributeError, EOFError):
+            pass
+
+    # temporary hack until benzene and ethanol are added
+    try:
+        # Ignore the vapor box
+        filled_box, _ = construct_system(
+            job.sp,
+            scale=scale,
+            packing=packing,
+            cache_dir=os.path.join(
+                Project().root_directory(), "packed_systems"
+            ),
+        )
+    except AttributeError:
+        return None
+    ff = load_ff(
+        job.sp.forcefield_name,
+        cache_dir=os.path.join(Project().root_directory(), "forcefields"),
+    )
+    structure = apply_ff(
+        ff,
+        filled_box,
+        cache_dir=os.path.join(Project().root_directory(), "atomtyping"),
+    )
+
+    # ref_distance: 10 angstrom -> 1 nm
+    # ref_energy: 1/4.184 kcal/mol -> 1 kJ/mol
+    # ref_mass: 0.9999938574 dalton -> 1 amu
+    d = 10
+    e = 1 / 4.184
+    m = 0.9999938574
+    snapshot, forcefield, ref_vals = create_hoomd_forcefield(
+        structure, ref_distance=d, ref_energy=e, ref_mass=m
+    )
+
+    os.makedirs(cache_dir, exist_ok=True)
+    sim = hoomd.Simulation(device=hoomd.device.CPU())
+    sim.create_state_from_snapshot(snapshot)
+    tmp = f"{system_fn}.{os.getpid()}.tmp"
+    hoomd.write.GSD.write(state=sim.state, filename=tmp, mode="wb")
+    os.replace(tmp, system_fn)
+    tmp = f"{forcefield_fn}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            pickle.dump(forcefield, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, forcefield_fn)
+    except (OSError, pickle.PicklingError, TypeError, AttributeError):
+        # The forces are rebuilt by the next replica instead.
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return system_fn, forcefield
+
+
+def _minimize_fire(sim, forcefield):
+    """Relax the overlaps of the initial configuration with FIRE.
+
+    The minimization stops once converged or after FIRE_STEPS steps. The
+    forces are detached afterwards, so they can be used by another
+    integrator.
+    """
+    import hoomd
+    import hoomd.md
+
+    fire = hoomd.md.minimize.FIRE(
+        dt=0.001, force_tol=1e-2, angmom_tol=1e-2, energy_tol=1e-7
+    )
+    fire.forces = forcefield
+    fire.methods = [hoomd.md.methods.NVE(filter=hoomd.filter.All())]
+    sim.operations.integrator = fire
+    end = sim.timestep + FIRE_STEPS
+    while not fire.converged and sim.timestep < end:
+        sim.run(min(100, end - sim.timestep))
+    fire.forces.clear()
+
+
+def _write_restart(sim, filename, log_file=None, thermostat=None):
+    """Atomically write the state of the simulation to a restart file.
+
+    The text log file, if any, is flushed first, so that it holds every row
+    up to the timestep of the restart file. The degrees of freedom of the
+    thermostat, if any, are written to "<filename>.json" with the timestep,
+    to be restored with _read_thermostat.
+    """
+    import hoomd
+
+    if log_file is not None:
+        log_file.flush()
+    if thermostat is not None:
+        dof = {
+            "timestep": sim.timestep,
+            "translational": list(thermostat.translational_thermostat_dof),
+            "rotational": list(thermostat.rotational_thermostat_dof),
+        }
+        tmp = f"{filename}.json.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(dof, f)
+        os.replace(tmp, f"{filename}.json")
+    tmp = f"{filename}.{os.getpid()}.tmp"
+    hoomd.write.GSD.write(state=sim.state, filename=tmp, mode="wb")
+    os.replace(tmp, filename)
+
+
+def _read_thermostat(filename, timestep, thermostat):
+    """Restore the thermostat written with the restart file `filename`.
+
+    Return False if there is no thermostat written at `timestep`.
+    """
+    if not os.path.isfile(f"{filename}.json"):
+        return False
+    with open(f"{filename}.json", "r") as f:
+        dof = json.load(f)
+    if dof["timestep"] != timestep:
+        return False
+    thermostat.translational_thermostat_dof = tuple(dof["translational"])
+    thermostat.rotational_thermostat_dof = tuple(dof["rotational"])
+    return True
+
+
+def _truncate_log(filename, timestep):
+    """Remove the rows written after `timestep` from a Table log.
+
+    A ValueError is raised if the rows can not be matched to timesteps, that
+    is if the log has no timestep column or rows before its first header.
+    """
+    if not os.path.isfile(filename):
+        return
+    with open(filename, "r") as f:
+        lines = f.readlines()
+    kept = []
+    column = None
+    for line in lines:
+        fields = line.split()
+        if not fields:
+            continue
+        if fields[0][0].isalpha():
+            column = next(
+                (i for i, name in enumerate(fields) if "timestep" in name),
+                None,
+            )
+            if column is None:
+                raise ValueError(
+                    f"Log {filename} has no timestep column, it can not be "
+                    f"truncated to the restart timestep {timestep}."
+                )
+        elif column is None:
+            raise ValueError(
+                f"Log {filename} has rows before its header, it can not be "
+                f"truncated to the restart timestep {timestep}."
+            )
+        elif not line.endswith("\n") or float(fields[column]) > timestep:
+            # Incomplete last row or row written after the restart file
+            continue
+        kept.append(line)
+    if len(kept) == len(lines):
+        return
+    tmp = f"{filename}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        f.writelines(kept)
+    os.replace(tmp, filename)
+
+
+def _truncate_gsd(filename, timestep):
+    """Remove the frames written after `timestep` from a GSD trajectory."""
+    import gsd.fl
+    import gsd.hoomd
+
+    if not os.path.isfile(filename):
+        return
+    with gsd.fl.open(name=filename, mode="rb") as f:
+        steps = [
+            f.read_chunk(frame=i, name="configuration/step")[0]
+            if f.chunk_exists(frame=i, name="configuration/step")
+            else 0
+            for i in range(f.nframes)
+        ]
+    n_frames = sum(step <= timestep for step in steps)
+    if n_frames == len(steps):
+        return
+    tmp = f"{filename}.{os.getpid()}.tmp"
+    with gsd.hoomd.open(filename, mode="rb") as old, gsd.hoomd.open(
+        tmp, mode="wb"
+    ) as new:
+        new.extend(old[i] for i in range(n_frames))
+    os.replace(tmp, filename)
 
 
 if __name__ == "__main__":
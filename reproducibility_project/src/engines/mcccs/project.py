@@ -30,7 +30,7 @@ def get_system(job):
 
     import mbuild as mb
 
-    from reproducibility_project.src.utils.forcefields import load_ff
+    from reproducibility_project.src.utils.forcefields import apply_ff, load_ff
 
     warnings.simplefilter("ignore")
     methane = mb.Compound(name="MET")
@@ -39,8 +39,15 @@ def get_system(job):
     box_liq = mb.fill_box(
         compound=methane, n_compounds=1230, box=[4.5, 4.5, 4.5]
     )
-    ff = load_ff(job.sp.forcefield_name)
-    parameterized_box_liquid = ff.apply(box_liq)
+    ff = load_ff(
+        job.sp.forcefield_name,
+        cache_dir=os.path.join(Project().root_directory(), "forcefields"),
+    )
+    parameterized_box_liquid = apply_ff(
+        ff,
+        box_liq,
+        cache_dir=os.path.join(Project().root_directory(), "atomtyping"),
+    )
     return box_liq
 
 
@@ -1,14 +1,87 @@
 """Methods used to create systems from job statepoint."""
+import hashlib
+import inspect
+import json
+import os
+
 import mbuild as mb
+import numpy as np
 from mbuild.lib.molecules.water import WaterSPC
 
 from reproducibility_project.src.molecules.methane_ua import MethaneUA
-from reproducibility_project.src.molecules.pentane_ua import PentaneUA
 
+# Update this dict as new recipes are made. Values are callables returning a
+# new compound, or the name of a mol2 file shipped in this directory.
+_MOLECULE_REGISTRY = {
+    "methaneUA": MethaneUA,
+    "pentaneUA": "pentane_ua.mol2",
+    "benzeneUA": "benzene_ua.mol2",
+    "waterSPC/E": WaterSPC,
+    "ethanolAA": "ethanol_aa.mol2",
+}
+_PROTOTYPES = {}
+_PACKINGS = ("packmol", "lattice")
+
+
+def get_molecule(name):
+    """Return a copy of the molecule registered under name.
+
+    Only the requested molecule is built. The first call in a process builds
+    a prototype (or loads it from its mol2 file) and caches it, later calls
+    return clones of the cached prototype.
+
+    Parameters
+    ----------
+    name : str
+        Name of the molecule, as used in the job statepoint.
+
+    Returns
+    -------
+    mbuild.Compound
+        The molecule, named after `name`.
+    """
+    if name not in _MOLECULE_REGISTRY:
+        raise ValueError(
+            f"Passed 'name' value: {name}, expected one of "
+            f"{list(_MOLECULE_REGISTRY)}."
+        )
+    if name not in _PROTOTYPES:
+        recipe = _MOLECULE_REGISTRY[name]
+        if isinstance(recipe, str):
+            prototype = mb.load(
+                os.path.join(os.path.dirname(os.path.abspath(__file__)), recipe)
+            )
+        else:
+            prototype = recipe()
+        _PROTOTYPES[name] = prototype
+    molecule = mb.clone(_PROTOTYPES[name])
+    molecule.name = name
+    return molecule
+
+
+def _molecule_source(name):
+    """Return the path of the file a registered molecule is built from."""
+    recipe = _MOLECULE_REGISTRY[name]
+    if isinstance(recipe, str):
+        return os.path.join(os.path.dirname(os.path.abspath(__file__)), recipe)
+    return inspect.getsourcefile(recipe)
 
-def construct_system(sp, scale=1.0):
+
+def construct_system(
+    sp, scale=1.0, seed=12345, cache_dir=None, packing="packmol"
+):
     """Construct systems according to job statepoint.
 
+    If `cache_dir` is provided, the packed coordinates and box of each system
+    are stored there in a compressed .npz file named after a hash of the
+    molecule, number of molecules, scaled box length, packing method and
+    seed. A later call with the same values reuses that packing instead of
+    packing the box again. The packing does not depend on the replica, so
+    the replicas of a statepoint share it and differ in the seed of their
+    simulations. Engines therefore only share a packing
+    if they use the same scale and packing method, as the GROMACS project
+    and the "fire" initialization of the HOOMD-blue project do.
+
     Parameters
     ----------
     sp: dict (from job.sp)
@@ -33,32 +106,241 @@ def construct_system(sp, scale=1.0):
     scale : float, default 1.0
         Scale factor by which to scale the box. Useful for system initialization
         if a shrink step makes equilibration easier.
+    seed : int, default 12345
+        Random seed of the packing.
+    cache_dir : str, default None
+        Directory of the packed system cache, e.g. in the project root. If
+        None, the systems are always packed.
+    packing : str, default "packmol"
+        How the molecules are placed in the box, "packmol" uses mb.fill_box,
+        "lattice" places randomly rotated molecules on a jittered
+        face-centered cubic lattice, which is much faster for large or
+        expanded boxes. Lattice positions are wrapped into the box, so
+        molecules crossing its boundary are split across periodic images.
 
     Returns
     -------
     [filled_liq_box, filled_vap_box]
         Return list of system as specified.
     """
-    # Update this dict as new recipes are made
-    molecule_dict = {
-        "methaneUA": MethaneUA(),
-        "pentaneUA": PentaneUA(),
-        "benzeneUA": None,
-        "waterSPC/E": WaterSPC(),
-        "ethanolAA": None,
-    }
-    molecule = molecule_dict[sp["molecule"]]
-    molecule.name = sp["molecule"]
-    liq_box = mb.Box([sp["box_L_liq"] * scale] * 3)
-    filled_liq_box = mb.fill_box(
-        compound=[molecule], n_compounds=[sp["N_liquid"]], box=liq_box
+    molecule = get_molecule(sp["molecule"])
+    filled_liq_box = _fill_box(
+        molecule,
+        sp["N_liquid"],
+        sp["box_L_liq"] * scale,
+        seed,
+        cache_dir,
+        packing,
     )
 
     if sp["box_L_vap"] and sp["N_vap"]:
-        vap_box = mb.Box([sp["box_L_vap"] * scale] * 3)
-        filled_vap_box = mb.fill_box(
-            compound=[molecule], n_compounds=[sp["N_vap"]], box=vap_box
+        filled_vap_box = _fill_box(
+            molecule,
+            sp["N_vap"],
+            sp["box_L_vap"] * scale,
+            seed,
+            cache_dir,
+            packing,
         )
         return [filled_liq_box, filled_vap_box]
     else:
         return [filled_liq_box, None]
+
+
+def _fill_box(molecule, n_compounds, box_L, seed, cache_dir, packing):
+    """Fill a cubic box with molecules, reusing a cached packing if any."""
+    if packing not in _PACKINGS:
+        raise ValueError(
+            f"Passed 'packing' value: {packing}, expected one of {_PACKINGS}."
+        )
+    if cache_dir is None:
+        return _pack(molecule, n_compounds, box_L, seed, packing)
+
+    key = json.dumps(
+        {
+            "molecule": molecule.name,
+            "n_compounds": n_compounds,
+            "box_L": box_L,
+            "seed": seed,
+            "packing": packing,
+        },
+        sort_keys=True,
+    )
+    cache_file = os.path.join(
+        cache_dir, hashlib.sha256(key.encode()).hexdigest() + ".npz"
+    )
+    if os.path.isfile(cache_file):
+        with np.load(cache_file) as data:
+            xyz = data["xyz"]
+            lengths = data["box"]
+        if molecule.n_particles * n_compounds == len(xyz):
+            return _filled_compound(molecule, n_compounds, xyz, lengths)
+
+    filled = _pack(molecule, n_compounds, box_L, seed, packing)
+    os.makedirs(cache_dir, exist_ok=True)
+    # Write to a unique temporary file first, so concurrent jobs packing the
+    # same system never read a partial file.
+    tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+    with open(tmp_file, "wb") as f:
+        np.savez_compressed(
+            f, xyz=filled.xyz, box=np.asarray(filled.box.lengths), key=key
+        )
+    os.replace(tmp_file, cache_file)
+    return filled
+
+
+def _pack(molecule, n_compounds, box_L, seed, packing):
+    """Pack molecules in a cubic box with packmol or on a lattice."""
+    if packing == "packmol":
+        return mb.fill_box(
+            compound=[molecule],
+            n_compounds=[n_compounds],
+            box=mb.Box([box_L] * 3),
+            seed=seed,
+        )
+    xyz = _lattice_xyz(
+        molecule.xyz, n_compounds, box_L, np.random.default_rng(seed)
+    )
+    return _filled_compound(molecule, n_compounds, xyz, [box_L] * 3)
+
+
+def _filled_compound(molecule, n_compounds, xyz, lengths):
+    """Return a compound of n_compounds clones of molecule at xyz."""
+    filled = mb.Compound()
+    for _ in range(n_compounds):
+        filled.add(mb.clone(molecule))
+    filled.xyz = xyz
+    filled.box = mb.Box(lengths)
+    return filled
+
+
+def _lattice_xyz(
+    local_xyz, n_compounds, box_L, rng, overlap=0.2, max_attempts=1000
+):
+    """Place randomly rotated copies of a molecule on a jittered lattice.
+
+    The molecules are centered on randomly chosen sites of a face-centered
+    cubic lattice with at least n_compounds sites, randomly rotated and displaced
+    by at most the free space around them. Molecules with a particle closer
+    than `overlap` (in nm) to a particle of another molecule are moved to a
+    random free site, or rotated again on their site if the lattice is full,
+    up to max_attempts times. Only the moved molecules are checked again, so
+    the cost is linear in n_compounds.
+
+    Returns
+    -------
+    numpy.ndarray
+        (n_compounds * len(local_xyz), 3) particle positions (in nm), in the
+        order of the molecules, wrapped into [0, box_L).
+    """
+    local_xyz = local_xyz - local_xyz.mean(axis=0)
+    radius = np.linalg.norm(local_xyz, axis=1).max()
+    n_side = int(np.ceil((n_compounds / 4) ** (1 / 3)))
+    spacing = box_L / n_side
+    free = np.ones(4 * n_side**3, dtype=bool)
+    sites = rng.choice(len(free), size=n_compounds, replace=False)
+    free[sites] = False
+    # Nearest neighbor sites are spacing / sqrt(2) apart.
+    max_shift = max((spacing / np.sqrt(2) - overlap) / 2 - radius, 0)
+
+    xyz = np.empty((n_compounds, len(local_xyz), 3))
+    todo = np.arange(n_compounds)
+    for attempt in range(max_attempts):
+        if attempt and free.any():
+            # Swap the sites of the overlapping molecules with free sites.
+            n_moved = min(len(todo), free.sum())
+            moved = rng.choice(todo, size=n_moved, replace=False)
+            new_sites = rng.choice(
+                np.flatnonzero(free), size=n_moved, replace=False
+            )
+            free[sites[moved]] = True
+            free[new_sites] = False
+            sites[moved] = new_sites
+        centers = _fcc_sites(sites[todo], n_side) * spacing
+        rotations = _random_rotations(len(todo), rng)
+        shifts = rng.uniform(-max_shift, max_shift, size=(len(todo), 3))
+        xyz[todo] = (
+            np.einsum("mij,pj->mpi", rotations, local_xyz)
+            + (centers + shifts)[:, None, :]
+        )
+        todo = _overlapping_molecules(xyz, box_L, overlap, todo)
+        if not len(todo):
+            return np.mod(xyz.reshape(-1, 3), box_L)
+    raise ValueError(
+        f"Could not place {n_compounds} molecules in a box of length {box_L} "
+        f"without overlaps within {max_attempts} attempts."
+    )
+
+
+def _fcc_sites(sites, n_side):
+    """Return the positions of fcc lattice sites in units of the cell length."""
+    basis = np.array(
+        [[0.0, 0.0, 0.0], [0.5, 0.5, 0.0], [0.5, 0.0, 0.5], [0.0, 0.5, 0.5]]
+    )
+    cells = np.column_stack(np.unravel_index(sites // 4, (n_side,) * 3))
+    return cells + basis[sites % 4] + 0.25
+
+
+def _random_rotations(n, rng):
+    """Return n uniformly distributed rotation matrices."""
+    q = rng.normal(size=(n, 4))
+    w, x, y, z = (q / np.linalg.norm(q, axis=1, keepdims=True)).T
+    return np.stack(
+        [
+            [1 - 2 * (y * y + z * z), 2 * (x * y - z * w), 2 * (x * z + y * w)],
+            [2 * (x * y + z * w), 1 - 2 * (x * x + z * z), 2 * (y * z - x * w)],
+            [2 * (x * z - y * w), 2 * (y * z + x * w), 1 - 2 * (x * x + y * y)],
+        ]
+    ).transpose(2, 0, 1)
+
+
+def _overlapping_molecules(xyz, box_L, overlap, candidates):
+    """Return the candidate molecules that overlap with another molecule.
+
+    Particles are binned in a periodic cell list with cells of at least
+    `overlap` length, and each particle of the candidates is compared with
+    the particles of the 27 surrounding cells at once. Of two overlapping
+    candidates only the later one is returned, so the earlier one can stay.
+    """
+    n_mol, n_per, _ = xyz.shape
+    points = xyz.reshape(-1, 3)
+    mol_id = np.repeat(np.arange(n_mol), n_per)
+    n_cells = max(int(box_L // overlap), 1)
+    cell = np.floor(points / box_L * n_cells).astype(int) % n_cells
+    cell_id = np.ravel_multi_index(cell.T, (n_cells,) * 3)
+
+    # Padded (n_cells**3, max occupancy) table of the particles in each cell.
+    order = np.argsort(cell_id, kind="stable")
+    counts = np.bincount(cell_id, minlength=n_cells**3)
+    starts = np.cumsum(counts) - counts
+    slot = np.arange(len(points)) - starts[cell_id[order]]
+    table = np.full((n_cells**3, counts.max()), -1)
+    table[cell_id[order], slot] = order
+
+    is_candidate = np.zeros(n_mol, dtype=bool)
+    is_candidate[candidates] = True
+    query = np.flatnonzero(is_candidate[mol_id])
+    overlapping = np.zeros(n_mol, dtype=bool)
+    offsets = np.unique(
+        np.array(np.meshgrid(*[[-1, 0, 1]] * 3)).reshape(3, -1).T % n_cells,
+        axis=0,
+    )
+    for offset in offsets:
+        neighbors = table[
+            np.ravel_multi_index(
+                ((cell[query] + offset) % n_cells).T, (n_cells,) * 3
+            )
+        ]
+        valid = neighbors >= 0
+        neighbors = np.where(valid, neighbors, 0)
+        delta = points[query, None, :] - points[neighbors]
+        delta -= box_L * np.round(delta / box_L)
+        other = mol_id[neighbors]
+        close = (
+            valid
+            & (np.einsum("ijk,ijk->ij", delta, delta) < overlap**2)
+            & (other != mol_id[query, None])
+            & (~is_candidate[other] | (other < mol_id[query, None]))
+        )
+        overlapping[mol_id[query[close.any(axis=1)]]] = True
+    return np.flatnonzero(overlapping)
@@ -1,31 +1,67 @@
 """Utilities to load forcefields based on forcefield names."""
+import functools
+import hashlib
+import json
 import os
+import pickle
+import weakref
 
 import foyer
+import numpy as np
+
+# Identity (name, XML modification time and foyer version) of the forcefields
+# returned by load_ff, used to key the atomtyping cache.
+_FF_KEYS = weakref.WeakKeyDictionary()
 
 
 def load_ff(
     name: str = None,
+    cache_dir: str = None,
 ) -> foyer.Forcefield:
     """Based on a forcefield name, return a foyer.Forcefield object.
 
     For the reproducibility project, multiple forcefield types are expected based on the molecule of study at that statepoint.
     This will return a foyer.Forcefield object based on a naming convention defined in the init.py within the reproducibility_project.
 
+    Loaded forcefields are cached in-process, keyed by name and by the
+    modification time of the forcefield XML, so repeated calls return the
+    same (shared) object. If `cache_dir` is provided (e.g. in the project
+    root), they are also pickled there, so a new process loads the parsed
+    forcefield instead of parsing the XML again. Editing the XML, or a
+    different foyer version, invalidates both caches. A cache file that can
+    not be loaded is removed and rebuilt.
+
     Parameters
     ----------
     name : str, default=None, optional
         Forcefield name to load.
+    cache_dir : str, default=None, optional
+        Directory of the on-disk forcefield cache, None disables it.
     """
+    ff_path = _ff_path(name)
+    try:
+        mtime_ns = os.stat(ff_path).st_mtime_ns
+    except OSError:
+        mtime_ns = None
+    return _load_ff(name, ff_path, mtime_ns, cache_dir)
+
+
+def _ff_path(name):
+    """Return the path of the XML file of a forcefield name."""
     if name in ["oplsaa", "trappe-ua"]:
-        return foyer.Forcefield(name=name)
+        return os.path.join(
+            os.path.dirname(os.path.abspath(foyer.__file__)),
+            "forcefields",
+            "xml",
+            f"{name}.xml",
+        )
     elif name == "spce":
         from reproducibility_project.src import xmls
 
         ff_path = (
             str(os.path.dirname(os.path.abspath(xmls.__file__))) + "/spce.xml"
         )
-        return foyer.Forcefield(forcefield_files=ff_path)
+        return ff_path
     elif name == "benzene-ua":
         from reproducibility_project.src import xmls
 
@@ -33,8 +69,195 @@ def load_ff(
         ff_path = (
             str(os.path.dirname(os.path.abspath(xmls.__file__))) + "/" + ff_name
         )
-        return foyer.Forcefield(forcefield_files=ff_path)
+        return ff_path
     else:
         raise ValueError(
             f"Unexpected forcefield name. Forcefield name {name} is not currently supported."
         )
+
+
+@functools.lru_cache(maxsize=8)
+def _load_ff(name, ff_path, mtime_ns, cache_dir):
+    """Load a forcefield through the on-disk cache."""
+    key = f"{ff_path}:{mtime_ns}:{foyer.__version__}"
+    cache_file = None
+    if cache_dir is not None and mtime_ns is not None:
+        cache_file = os.path.join(
+            cache_dir,
+            f"{name}-{hashlib.sha256(key.encode()).hexdigest()[:16]}.pkl",
+        )
+        ff = _load_pickle(cache_file)
+        if ff is not None:
+            _FF_KEYS[ff] = f"{name}:{key}"
+            return ff
+
+    if name in ["oplsaa", "trappe-ua"]:
+        ff = foyer.Forcefield(name=name)
+    else:
+        ff = foyer.Forcefield(forcefield_files=ff_path)
+
+    if cache_file is not None:
+        tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(tmp_file, "wb") as f:
+                pickle.dump(ff, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_file, cache_file)
+        except (OSError, pickle.PicklingError, TypeError, AttributeError):
+            # The on-disk cache is an optimization only.
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+    if mtime_ns is not None:
+        _FF_KEYS[ff] = f"{name}:{key}"
+    return ff
+
+
+def apply_ff(ff, system, cache_dir=None, verify=False, **kwargs):
+    """Parameterize a box of identical molecules, atomtyping only one of them.
+
+    The first molecule of the system is parameterized with `ff.apply` and its
+    parameterized topology is replicated once per molecule, with the
+    coordinates and box of the system. The cost of atomtyping therefore does
+    not depend on the number of molecules. Systems whose children are not
+    all copies of the same molecule (same particle names, elements and bonds
+    in particle order), or that have no box, are parameterized with
+    `ff.apply` directly.
+
+    If `cache_dir` is provided (e.g. in the project root), for forcefields
+    returned by load_ff, the parameterized molecule is also pickled there,
+    keyed by the forcefield (name, XML modification
+    time and foyer version), the molecular graph (particle names, elements
+    and bonds in particle order) and the keyword arguments. Jobs and replicas
+    using the same molecule and forcefield then skip the SMARTS matching.
+
+    Parameters
+    ----------
+    ff : foyer.Forcefield
+        The forcefield to apply.
+    system : mbuild.Compound
+        The system, e.g. a box filled by construct_system, whose children are
+        the molecules.
+    cache_dir : str, default=None, optional
+        Directory of the atomtyping cache, None disables it.
+    verify : bool, default=False, optional
+        On a cache hit, also apply the forcefield and raise a ValueError if
+        the parameters differ from the cached ones.
+    **kwargs
+        Keyword arguments passed to `ff.apply`.
+
+    Returns
+    -------
+    parmed.Structure
+        The parameterized system.
+    """
+    molecules = system.children
+    if not molecules or system.box is None:
+        return ff.apply(system, **kwargs)
+    graph = _graph_key(molecules[0])
+    for molecule in molecules[1:]:
+        if _graph_key(molecule) != graph:
+            return ff.apply(system, **kwargs)
+
+    structure = _apply_cached(ff, molecules[0], cache_dir, verify, **kwargs)
+    structure = structure * len(molecules)
+    # mbuild works in nm, parmed in Angstrom.
+    structure.coordinates = system.xyz * 10
+    structure.box = np.concatenate(
+        [np.asarray(system.box.lengths) * 10, system.box.angles]
+    )
+    return structure
+
+
+def _apply_cached(ff, molecule, cache_dir, verify, **kwargs):
+    """Apply a forcefield to a molecule through the atomtyping cache."""
+    ff_key = _FF_KEYS.get(ff)
+    if cache_dir is None or ff_key is None:
+        return ff.apply(molecule, **kwargs)
+
+    key = json.dumps(
+        [ff_key, _graph_key(molecule), kwargs], sort_keys=True, default=str
+    )
+    cache_file = os.path.join(
+        cache_dir, hashlib.sha256(key.encode()).hexdigest() + ".pkl"
+    )
+    structure = _load_pickle(cache_file)
+    if structure is None:
+        structure = ff.apply(molecule, **kwargs)
+        tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(tmp_file, "wb") as f:
+                pickle.dump(structure, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_file, cache_file)
+        except (OSError, pickle.PicklingError, TypeError, AttributeError):
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+        return structure
+
+    structure.coordinates = molecule.xyz * 10
+    if verify:
+        fresh = _parameter_signature(ff.apply(molecule, **kwargs))
+        if _parameter_signature(structure) != fresh:
+            raise ValueError(
+                f"Cached atomtyping in {cache_file} differs from a fresh "
+                "application of the forcefield."
+            )
+    return structure
+
+
+def _load_pickle(cache_file):
+    """Load a pickled cache file, None if it is missing or corrupt.
+
+    A file that exists but can not be loaded (e.g. truncated, or pickled
+    with other versions of the packages) is removed, so it is rebuilt.
+    """
+    try:
+        with open(cache_file, "rb") as f:
+            return pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception:
+        try:
+            os.remove(cache_file)
+        except OSError:
+            pass
+        return None
+
+
+def _graph_key(molecule):
+    """Return the particle names, elements and bonds of a molecule."""
+    particles = list(molecule.particles())
+    index = {id(particle): i for i, particle in enumerate(particles)}
+    elements = [
+        getattr(getattr(particle, "element", None), "symbol", None)
+        for particle in particles
+    ]
+    bonds = sorted(
+        sorted((index[id(a)], index[id(b)])) for a, b in molecule.bonds()
+    )
+    return [[particle.name for particle in particles], elements, bonds]
+
+
+def _parameter_signature(structure):
+    """Return the atom types and parameters of a parmed.Structure."""
+
+    def _type(term):
+        return None if term.type is None else str(term.type)
+
+    return (
+        [
+            (atom.name, atom.type, atom.charge, atom.sigma, atom.epsilon)
+            for atom in structure.atoms
+        ],
+        [(b.atom1.idx, b.atom2.idx, _type(b)) for b in structure.bonds],
+        [
+            (a.atom1.idx, a.atom2.idx, a.atom3.idx, _type(a))
+            for a in structure.angles
+        ],
+        [
+            (d.atom1.idx, d.atom2.idx, d.atom3.idx, d.atom4.idx, _type(d))
+            for d in structure.dihedrals + structure.rb_torsions
+        ],
+        [(a.atom1.idx, a.atom2.idx, _type(a)) for a in structure.adjusts],
+        structure.combining_rule,
+    )
@@ -41,6 +41,12 @@ class BaseTest:
         create_gsd(filename)
         return filename
 
+    @pytest.fixture
+    def gsdfile_bonds(self, tmp_path):
+        filename = tmp_path / "traj_random_bonds.gsd"
+        create_gsd(filename, bonds=True)
+        return filename
+
     @pytest.fixture
     def gsdfile_xstal(self, tmp_path):
         filename = tmp_path / "traj_xstal.gsd"
@@ -1,9 +1,12 @@
 import numpy as np
 import pytest
-from pymbar import testsystems
+from pymbar import testsystems, timeseries
 
 from reproducibility_project.src.analysis.equlibration import (
+    _detect_equilibration_adaptive,
+    _detect_equilibration_cumsum,
     is_equilibrated,
+    is_equilibrated_multi,
     trim_non_equilibrated,
 )
 from reproducibility_project.tests.base_test import BaseTest
@@ -41,3 +44,121 @@ class TestEquilibration(BaseTest):
         )
         with pytest.raises(ValueError, match=r"Data with a threshold"):
             [new_a_t, g, t0] = trim_non_equilibrated(data, threshold=0.98)
+
+    @pytest.mark.parametrize("nskip", [1, 10])
+    def test_cumsum_matches_pymbar(self, nskip):
+        data = testsystems.correlated_timeseries_example(
+            N=1000, tau=200, seed=432
+        )
+        [t0, g, neff] = timeseries.detectEquilibration(data, nskip=nskip)
+        [t0_c, g_c, neff_c] = _detect_equilibration_cumsum(data, nskip=nskip)
+        assert t0_c == t0
+        assert np.isclose(g_c, g, rtol=1e-5)
+        assert np.isclose(neff_c, neff, rtol=1e-5)
+
+    def test_cumsum_method(self):
+        data = testsystems.correlated_timeseries_example(
+            N=1000, tau=200, seed=432
+        )
+        for threshold in [0.80, 0.40, 0.10]:
+            assert is_equilibrated(
+                data, threshold=threshold, method="cumsum"
+            ) == pytest.approx(is_equilibrated(data, threshold=threshold))
+
+    def test_incorrect_method(self):
+        data = testsystems.correlated_timeseries_example(
+            N=1000, tau=200, seed=432
+        )
+        with pytest.raises(ValueError, match=r"Passed \'method\' value"):
+            is_equilibrated(data, method="foo")
+
+    def test_multi_matches_single(self):
+        data = np.column_stack(
+            [
+                testsystems.correlated_timeseries_example(
+                    N=1000, tau=tau, seed=432
+                )
+                for tau in [5, 20, 200]
+            ]
+        )
+        [results, prod_start] = is_equilibrated_multi(data, threshold=0.4)
+        assert list(results) == [0, 1, 2]
+        for column, result in results.items():
+            expected = is_equilibrated(data[:, column], threshold=0.4)
+            assert result == pytest.approx(expected)
+        assert prod_start == max(result[1] for result in results.values())
+
+    def test_multi_structured_array(self):
+        names = ["potential_energy", "pressure", "volume"]
+        data = np.zeros(
+            1000, dtype=[(name, np.float64) for name in ["timestep"] + names]
+        )
+        data["timestep"] = np.arange(1000)
+        for seed, name in enumerate(names):
+            data[name] = testsystems.correlated_timeseries_example(
+                N=1000, tau=20, seed=seed
+            )
+        [results, prod_start] = is_equilibrated_multi(
+            data, threshold=0.1, columns=names
+        )
+        assert list(results) == names
+        assert all(result[0] for result in results.values())
+        assert prod_start == max(result[1] for result in results.values())
+
+    def test_multi_incorrect_shape(self):
+        data = testsystems.correlated_timeseries_example(
+            N=1000, tau=200, seed=432
+        )
+        with pytest.raises(ValueError, match=r"Expected a 2-D"):
+            is_equilibrated_multi(data)
+
+    @pytest.mark.parametrize("nskip", [1, 5])
+    def test_adaptive_matches_exhaustive(self, nskip):
+        data = testsystems.correlated_timeseries_example(
+            N=10000, tau=20, seed=432
+        )
+        data[:1000] += np.linspace(3, 0, 1000)
+        [t0, g, neff] = _detect_equilibration_cumsum(data, nskip=nskip)
+        [t0_a, g_a, neff_a] = _detect_equilibration_adaptive(data, nskip=nskip)
+        assert abs(t0_a - t0) <= nskip
+        assert np.isclose(neff_a, neff, rtol=1e-2)
+
+    def test_adaptive_methods_agree(self):
+        data = testsystems.correlated_timeseries_example(
+            N=1000, tau=200, seed=432
+        )
+        [truth, t0, g] = is_equilibrated(
+            data, threshold=0.1, method="pymbar", search="adaptive"
+        )
+        [truth_c, t0_c, g_c] = is_equilibrated(
+            data, threshold=0.1, method="cumsum", search="adaptive"
+        )
+        assert truth == truth_c
+        assert t0 == t0_c
+        assert np.isclose(g, g_c)
+
+    def test_adaptive_multi(self):
+        data = np.column_stack(
+            [
+                testsystems.correlated_timeseries_example(
+                    N=1000, tau=tau, seed=432
+                )
+                for tau in [5, 20, 200]
+            ]
+        )
+        [results, prod_start] = is_equilibrated_multi(
+            data, threshold=0.1, search="adaptive"
+        )
+        assert list(results) == [0, 1, 2]
+        assert prod_start == max(result[1] for result in results.values())
+        # The weakly correlated column matches the exhaustive search.
+        assert results[0] == pytest.approx(
+            is_equilibrated(data[:, 0], threshold=0.1, method="cumsum")
+        )
+
+    def test_incorrect_search(self):
+        data = testsystems.correlated_timeseries_example(
+            N=1000, tau=200, seed=432
+        )
+        with pytest.raises(ValueError, match=r"Passed \'search\' value"):
+            is_equilibrated(data, search="foo")
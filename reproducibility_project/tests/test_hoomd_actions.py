@@ -0,0 +1,56 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from reproducibility_project.tests.base_test import BaseTest
+
+hoomd = pytest.importorskip("hoomd")
+
+from reproducibility_project.src.engines.hoomd.actions import (
+    DecorrelationMonitor,
+)
+
+
+def fill(monitor, values):
+    for i, value in enumerate(values):
+        monitor.thermo.potential_energy = value
+        monitor.act((i + 1) * 5000)
+
+
+class TestDecorrelationMonitor(BaseTest):
+    def test_constant(self):
+        monitor = DecorrelationMonitor(
+            SimpleNamespace(), n_samples=10, check_period=1000
+        )
+        fill(monitor, np.zeros(100))
+        monitor.check()
+        assert not monitor.equilibrated
+        assert monitor.n_uncorrelated == 0
+        assert not monitor.done
+
+    def test_white_noise(self):
+        monitor = DecorrelationMonitor(
+            SimpleNamespace(), n_samples=100, check_period=1000
+        )
+        fill(monitor, np.random.default_rng(1).normal(size=400))
+        monitor.check()
+        assert monitor.equilibrated
+        assert monitor.n_uncorrelated >= 300
+        assert monitor.done
+
+    def test_non_finite_inefficiency(self, monkeypatch):
+        from reproducibility_project.src.engines.hoomd import actions
+
+        monkeypatch.setattr(
+            actions,
+            "is_equilibrated_multi",
+            lambda *args, **kwargs: [{0: [True, 0, np.nan]}, 0],
+        )
+        monitor = DecorrelationMonitor(
+            SimpleNamespace(), n_samples=10, check_period=1000
+        )
+        fill(monitor, np.random.default_rng(1).normal(size=100))
+        monitor.check()
+        assert monitor.n_uncorrelated == 0
+        assert not monitor.done
@@ -0,0 +1,28 @@
+from reproducibility_project.init import (
+    generate_statepoints,
+    init_jobs,
+    md_engines,
+)
+from reproducibility_project.tests.base_test import BaseTest
+
+
+class TestInit(BaseTest):
+    def test_constraints(self):
+        for sp in generate_statepoints():
+            assert sp["ensemble"] is not None
+            if sp["engine"] in md_engines:
+                assert sp["ensemble"] != "GEMC-NVT"
+            if sp["ensemble"] == "NPT":
+                assert sp["N_vap"] is None
+                assert sp["box_L_vap"] is None
+
+    def test_init_jobs_incremental(self, tmp_project):
+        statepoints = list(generate_statepoints())[:40]
+        new_jobs = init_jobs(tmp_project, statepoints[:20])
+        assert len(new_jobs) == len(tmp_project)
+        more_jobs = init_jobs(tmp_project, statepoints)
+        assert {job.id for job in more_jobs}.isdisjoint(
+            job.id for job in new_jobs
+        )
+        assert len(tmp_project) == len(new_jobs) + len(more_jobs)
+        assert init_jobs(tmp_project, statepoints) == []
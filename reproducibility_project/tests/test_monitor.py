@@ -0,0 +1,98 @@
+import json
+
+import numpy as np
+import pytest
+from pymbar import testsystems
+
+from reproducibility_project.src.analysis.equlibration import is_equilibrated
+from reproducibility_project.src.analysis.monitor import monitor_job
+from reproducibility_project.tests.base_test import BaseTest
+
+
+def write_log(filename, data, start=0, mode="w", header=True):
+    with open(filename, mode) as f:
+        if header:
+            f.write("timestep potential_energy\n")
+        for i, value in enumerate(data):
+            f.write(f"{(start + i) * 5000} {value}\n")
+
+
+class TestMonitor(BaseTest):
+    @pytest.fixture
+    def data(self):
+        return testsystems.correlated_timeseries_example(
+            N=1000, tau=20, seed=432
+        )
+
+    def test_full_log(self, tmp_job, data):
+        write_log(tmp_job.fn("log.txt"), data)
+        result = monitor_job(tmp_job, threshold=0.1)
+        assert result["n_samples"] == 1000
+        # Fewer rows than max_blocks, so the blocks are the raw data.
+        assert result["block_size"] == 1
+        [truth, t0, g] = is_equilibrated(data, threshold=0.1, method="cumsum")
+        assert result["equilibrated"] == truth
+        assert result["t0"] == t0
+        assert np.isclose(result["g"], g)
+        assert result["n_decorrelated"] == int((1000 - t0) / g)
+        assert tmp_job.doc.monitor_results["potential_energy"] == result
+
+    def test_incremental_matches_single_pass(self, tmp_project, data):
+        job_a = tmp_project.open_job({"a": 0}).init()
+        job_b = tmp_project.open_job({"a": 1}).init()
+
+        write_log(job_a.fn("log.txt"), data)
+        result_a = monitor_job(job_a, max_blocks=64)
+
+        # Simulate a restarted run appending to the log, including a header
+        # and a trailing incomplete line that must be left for later.
+        write_log(job_b.fn("log.txt"), data[:333])
+        monitor_job(job_b, max_blocks=64)
+        write_log(job_b.fn("log.txt"), data[333:700], start=333, mode="a")
+        with open(job_b.fn("log.txt"), "a") as f:
+            f.write(f"{700 * 5000} {data[700]}")
+        assert monitor_job(job_b, max_blocks=64)["n_samples"] == 700
+        with open(job_b.fn("log.txt"), "a") as f:
+            f.write("\n")
+        write_log(
+            job_b.fn("log.txt"), data[701:], start=701, mode="a", header=False
+        )
+        result_b = monitor_job(job_b, max_blocks=64)
+
+        assert result_b == result_a
+        assert result_a["block_size"] == 16
+        with open(job_a.fn("log.txt.monitor.json")) as fa, open(
+            job_b.fn("log.txt.monitor.json")
+        ) as fb:
+            state_a = json.load(fa)
+            state_b = json.load(fb)
+        assert np.allclose(state_a.pop("blocks"), state_b.pop("blocks"))
+        assert np.allclose(
+            state_a.pop("partial_sum"), state_b.pop("partial_sum")
+        )
+        # job_b's log holds one more header line.
+        assert state_a.pop("offset") < state_b.pop("offset")
+        state_a.pop("fingerprint")
+        state_b.pop("fingerprint")
+        assert state_a == state_b
+
+    def test_rewritten_longer_log(self, tmp_project, data):
+        job_a = tmp_project.open_job({"a": 0}).init()
+        job_b = tmp_project.open_job({"a": 1}).init()
+        write_log(job_a.fn("log.txt"), data[500:])
+        result_a = monitor_job(job_a, max_blocks=64)
+
+        write_log(job_b.fn("log.txt"), data[:400])
+        monitor_job(job_b, max_blocks=64)
+        # A run restarted from scratch that has grown past the old offset.
+        write_log(job_b.fn("log.txt"), data[500:])
+        assert monitor_job(job_b, max_blocks=64) == result_a
+
+    def test_missing_variable(self, tmp_job, data):
+        write_log(tmp_job.fn("log.txt"), data)
+        with pytest.raises(ValueError, match=r"Variable pressure not found"):
+            monitor_job(tmp_job, variable="pressure")
+
+    def test_incorrect_max_blocks(self, tmp_job):
+        with pytest.raises(ValueError, match=r"Passed \'max_blocks\' value"):
+            monitor_job(tmp_job, max_blocks=3)
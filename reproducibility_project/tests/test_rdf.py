@@ -1,7 +1,14 @@
 import freud
+import gsd.hoomd
 import numpy as np
 
-from reproducibility_project.src.analysis.rdf import _gsd_rdf, gsd_rdf
+from reproducibility_project.src.analysis.rdf import (
+    ReducedRDF,
+    _gsd_partial_rdf,
+    _gsd_rdf,
+    gsd_partial_rdf,
+    gsd_rdf,
+)
 from reproducibility_project.tests.base_test import BaseTest
 
 
@@ -10,6 +17,8 @@ class TestRDF(BaseTest):
 
     def test_rdf(self, job_gsdfile):
         rdf = gsd_rdf(job_gsdfile)
+        assert isinstance(rdf, freud.density.RDF)
+        assert not job_gsdfile.isfile("rdf_frames.npz")
 
     def test_gsdfile_random(self, gsdfile_random):
         rdf = _gsd_rdf(gsdfile_random)
@@ -22,3 +31,137 @@ class TestRDF(BaseTest):
         assert isinstance(rdf, freud.density.RDF)
         assert np.isclose(max(rdf.rdf), 2.5770662)
         assert len(rdf.rdf) == 50
+
+    def test_parallel_matches_serial(self, gsdfile_random):
+        serial = _gsd_rdf(gsdfile_random, frames=7, stride=1)
+        parallel = _gsd_rdf(gsdfile_random, frames=7, stride=1, n_workers=3)
+        assert isinstance(parallel, ReducedRDF)
+        assert parallel.n_frames == 7
+        assert np.array_equal(parallel.bin_counts, serial.bin_counts)
+        assert np.allclose(parallel.bin_centers, serial.bin_centers)
+        assert np.allclose(parallel.rdf, serial.rdf)
+
+    def test_parallel_job(self, job_gsdfile):
+        rdf = gsd_rdf(job_gsdfile, n_workers=2)
+        assert isinstance(rdf, ReducedRDF)
+        assert job_gsdfile.isfile("rdf.txt")
+
+    def test_partial_sums_to_total(self, gsdfile_random):
+        bin_centers, rdfs = _gsd_partial_rdf(
+            gsdfile_random, exclude_intramolecular=False
+        )
+        rdf = _gsd_rdf(gsdfile_random)
+        assert list(rdfs) == ["A-A", "A-B", "B-B"]
+        assert np.allclose(bin_centers, rdf.bin_centers)
+        # 25 "A" and 25 "B" particles
+        total = (rdfs["A-A"] + 2 * rdfs["A-B"] + rdfs["B-B"]) / 4
+        assert np.allclose(total, rdf.rdf, atol=1e-4)
+
+    def test_partial_intramolecular_exclusion(self, gsdfile_bonds):
+        _, excluded = _gsd_partial_rdf(gsdfile_bonds)
+        _, included = _gsd_partial_rdf(
+            gsdfile_bonds, exclude_intramolecular=False
+        )
+        for pair in ["A-A", "A-B", "B-B"]:
+            assert np.all(excluded[pair] <= included[pair])
+        # Every bond is an A-B pair
+        assert excluded["A-B"].sum() < included["A-B"].sum()
+
+    def test_partial_job(self, job_gsdfile):
+        bin_centers, rdfs = gsd_partial_rdf(job_gsdfile)
+        data = np.genfromtxt(job_gsdfile.fn("rdf_partial.txt"), names=True)
+        assert data.dtype.names == ("r", "AA", "AB", "BB")
+        assert np.allclose(data["AB"], rdfs["A-B"])
+
+    def test_frame_cache(self, job_gsdfile, monkeypatch):
+        from reproducibility_project.src.analysis import rdf as rdf_module
+
+        rdf = gsd_rdf(job_gsdfile, frames=5, cache=True)
+        serial = _gsd_rdf(job_gsdfile.fn("trajectory.gsd"), frames=5)
+        assert isinstance(rdf, ReducedRDF)
+        assert np.array_equal(rdf.bin_counts, serial.bin_counts)
+        assert np.allclose(rdf.rdf, serial.rdf)
+        assert job_gsdfile.isfile("rdf_frames.npz")
+
+        computed = []
+        frame_counts = rdf_module._rdf_frame_counts
+
+        def spy(systems, *args):
+            computed.append(len(systems))
+            return frame_counts(systems, *args)
+
+        monkeypatch.setattr(rdf_module, "_rdf_frame_counts", spy)
+        # All frames are cached
+        cached = gsd_rdf(job_gsdfile, frames=5, cache=True)
+        assert computed == []
+        assert np.array_equal(cached.bin_counts, rdf.bin_counts)
+        # Only the frames missing from the cache are computed
+        gsd_rdf(job_gsdfile, frames=8, cache=True)
+        assert computed == [3]
+        # A different binning invalidates the cache
+        gsd_rdf(job_gsdfile, frames=8, bins=20, cache=True)
+        assert computed == [3, 8]
+
+    def test_frame_cache_box_change(self, job_gsdfile, monkeypatch):
+        from reproducibility_project.src.analysis import rdf as rdf_module
+        from reproducibility_project.tests.utils import create_frame_random
+
+        rdf = gsd_rdf(job_gsdfile, frames=10, cache=True)
+        computed = []
+        frame_counts = rdf_module._rdf_frame_counts
+
+        def spy(systems, *args):
+            computed.append(len(systems))
+            return frame_counts(systems, *args)
+
+        monkeypatch.setattr(rdf_module, "_rdf_frame_counts", spy)
+        # Frames with a smaller box are appended, as in an NPT run
+        with gsd.hoomd.open(job_gsdfile.fn("trajectory.gsd"), "rb+") as f:
+            f.extend(
+                [
+                    create_frame_random(i, bonds=False, L=9.5, seed=i)
+                    for i in range(10, 13)
+                ]
+            )
+        appended = gsd_rdf(job_gsdfile, frames=13, cache=True)
+        assert computed == [3]
+        assert np.allclose(appended.bin_edges, rdf.bin_edges)
+
+    def test_frame_cache_rewritten(self, job_gsdfile, monkeypatch):
+        from reproducibility_project.src.analysis import rdf as rdf_module
+        from reproducibility_project.tests.utils import create_frame_random
+
+        gsd_rdf(job_gsdfile, frames=10, cache=True)
+        computed = []
+        frame_counts = rdf_module._rdf_frame_counts
+
+        def spy(systems, *args):
+            computed.append(len(systems))
+            return frame_counts(systems, *args)
+
+        monkeypatch.setattr(rdf_module, "_rdf_frame_counts", spy)
+        # The last frames are rewritten with the same steps, as after a
+        # restart
+        fn = job_gsdfile.fn("trajectory.gsd")
+        with gsd.hoomd.open(fn, "rb") as f:
+            kept = list(f[:7])
+        with gsd.hoomd.open(fn, "wb") as f:
+            f.extend(kept)
+            f.extend(
+                [
+                    create_frame_random(i, bonds=False, seed=100 + i)
+                    for i in range(7, 10)
+                ]
+            )
+        rewritten = gsd_rdf(job_gsdfile, frames=10, cache=True)
+        assert computed == [3]
+        serial = _gsd_rdf(fn, frames=10)
+        assert np.array_equal(rewritten.bin_counts, serial.bin_counts)
+
+    def test_block_error(self, job_gsdfile):
+        rdf = gsd_rdf(job_gsdfile, frames=10, n_blocks=5)
+        assert rdf.rdf_err.shape == rdf.rdf.shape
+        assert np.all(rdf.rdf_err >= 0)
+        data = np.loadtxt(job_gsdfile.fn("rdf.txt"))
+        assert data.shape == (50, 3)
+        assert np.allclose(data[:, 2], rdf.rdf_err)
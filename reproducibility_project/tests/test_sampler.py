@@ -1,8 +1,12 @@
+import numpy as np
 import pytest
 from pymbar import testsystems
 
 from reproducibility_project.src.analysis.equlibration import is_equilibrated
-from reproducibility_project.src.analysis.sampler import _decorr_sampling
+from reproducibility_project.src.analysis.sampler import (
+    _decorr_sampling,
+    sample_job,
+)
 from reproducibility_project.tests.base_test import BaseTest
 
 
@@ -24,3 +28,89 @@ class TestSampler(BaseTest):
         start, stop, step = _decorr_sampling(data, threshold=0.10)
         assert start >= prod_start
         assert step >= ineff
+
+    def test_sample_job_cache(self, tmp_job, monkeypatch):
+        from reproducibility_project.src.analysis import sampler
+
+        data = testsystems.correlated_timeseries_example(
+            N=1000, tau=5, seed=432
+        )
+        np.savetxt(
+            tmp_job.fn("log.txt"),
+            np.column_stack([np.arange(1000), data]),
+            header="timestep potential_energy",
+            comments="",
+        )
+        sample_job(tmp_job, threshold=0.5)
+        sample_job(tmp_job, threshold=0.6)
+        results = list(tmp_job.doc.sampling_results["potential_energy"])
+        entries = dict(tmp_job.doc.sampling_cache["potential_energy"])
+        assert len(entries) == 2
+        cached = dict(entries[sampler._cache_key(threshold=0.6, nskip=1)])
+        assert results == list(
+            range(cached["start"], cached["stop"], cached["step"])
+        )
+
+        def fail(*args, **kwargs):
+            raise AssertionError("Cached results were recomputed.")
+
+        # An unchanged log with previously used parameters is a cache hit.
+        with monkeypatch.context() as m:
+            m.setattr(sampler, "_equilibrated_sampling", fail)
+            sample_job(tmp_job, threshold=0.5)
+            sample_job(tmp_job, threshold=0.6)
+            with pytest.raises(AssertionError, match=r"recomputed"):
+                sample_job(tmp_job, threshold=0.7)
+
+        # A grown log invalidates the cache.
+        with open(tmp_job.fn("log.txt"), "a") as f:
+            f.write(f"1000 {data[-1]}\n")
+        with monkeypatch.context() as m:
+            m.setattr(sampler, "_equilibrated_sampling", fail)
+            with pytest.raises(AssertionError, match=r"recomputed"):
+                sample_job(tmp_job, threshold=0.6)
+        sample_job(tmp_job, threshold=0.6)
+        key = sampler._cache_key(threshold=0.6, nskip=1)
+        assert tmp_job.doc.sampling_cache["potential_energy"][key]["data"] != (
+            cached["data"]
+        )
+
+    def test_sample_job_gsd_log(self, tmp_project, tmp_job):
+        from reproducibility_project.tests.test_thermo_log import (
+            write_gsd_log,
+        )
+
+        data = testsystems.correlated_timeseries_example(
+            N=1000, tau=5, seed=432
+        )
+        tmp_project.doc.hoomd_log_format = "gsd"
+        write_gsd_log(
+            tmp_job.fn("log.gsd"),
+            np.column_stack([np.arange(1000), data, data]),
+        )
+        sample_job(tmp_job, threshold=0.5)
+        assert not tmp_job.isfile("log.txt")
+        assert len(tmp_job.doc.sampling_results["potential_energy"])
+
+    def test_sample_job_cache_not_equilibrated(self, tmp_job, monkeypatch):
+        from reproducibility_project.src.analysis import sampler
+
+        data = testsystems.correlated_timeseries_example(
+            N=1000, tau=200, seed=432
+        )
+        np.savetxt(
+            tmp_job.fn("log.txt"),
+            np.column_stack([np.arange(1000), data]),
+            header="timestep potential_energy",
+            comments="",
+        )
+        with pytest.raises(ValueError, match=r"threshold"):
+            sample_job(tmp_job, threshold=0.8)
+
+        def fail(*args, **kwargs):
+            raise AssertionError("Cached results were recomputed.")
+
+        with monkeypatch.context() as m:
+            m.setattr(sampler, "_equilibrated_sampling", fail)
+            with pytest.raises(ValueError, match=r"threshold"):
+                sample_job(tmp_job, threshold=0.8)
@@ -1,5 +1,12 @@
+import os
+
+import numpy as np
+import pytest
+
+from reproducibility_project.src.molecules import system_builder
 from reproducibility_project.src.molecules.system_builder import (
     construct_system,
+    get_molecule,
 )
 from reproducibility_project.tests.base_test import BaseTest
 
@@ -12,3 +19,74 @@ class TestSystemBuilder(BaseTest):
 
     def test_liq_and_vap(self, mock_job_gemc):
         systems = construct_system(mock_job_gemc)
+
+    @pytest.mark.parametrize(
+        "name, n_particles",
+        [("pentaneUA", 5), ("benzeneUA", 6), ("ethanolAA", 9)],
+    )
+    def test_mol2_molecules(self, name, n_particles):
+        molecule = get_molecule(name)
+        assert molecule.name == name
+        assert molecule.n_particles == n_particles
+
+    def test_prototype_cached(self):
+        first = get_molecule("methaneUA")
+        prototype = system_builder._PROTOTYPES["methaneUA"]
+        second = get_molecule("methaneUA")
+        assert system_builder._PROTOTYPES["methaneUA"] is prototype
+        assert first is not second and first is not prototype
+
+    def test_unknown_molecule(self):
+        with pytest.raises(ValueError):
+            get_molecule("argon")
+
+    @pytest.mark.parametrize(
+        "name, source",
+        [("methaneUA", "methane_ua.py"), ("pentaneUA", "pentane_ua.mol2")],
+    )
+    def test_molecule_source(self, name, source):
+        fn = system_builder._molecule_source(name)
+        assert os.path.basename(fn) == source
+        assert os.path.isfile(fn)
+
+    def test_packing_cache(self, mock_job_gemc, tmp_path):
+        liq, vap = construct_system(mock_job_gemc, cache_dir=tmp_path)
+        assert len(list(tmp_path.glob("*.npz"))) == 2
+        cached_liq, cached_vap = construct_system(
+            mock_job_gemc, cache_dir=tmp_path
+        )
+        assert np.allclose(cached_liq.xyz, liq.xyz)
+        assert np.allclose(cached_vap.xyz, vap.xyz)
+        assert np.allclose(cached_liq.box.lengths, liq.box.lengths)
+        assert cached_liq.n_bonds == liq.n_bonds
+
+        # Replicas share the packing
+        construct_system(dict(mock_job_gemc, replica=2), cache_dir=tmp_path)
+        assert len(list(tmp_path.glob("*.npz"))) == 2
+
+        construct_system(mock_job_gemc, scale=2, cache_dir=tmp_path)
+        assert len(list(tmp_path.glob("*.npz"))) == 4
+
+    def test_lattice_packing(self, mock_job_gemc):
+        liq, vap = construct_system(mock_job_gemc, packing="lattice")
+        assert liq.n_particles == mock_job_gemc["N_liquid"] * 5
+        assert vap.n_particles == mock_job_gemc["N_vap"] * 5
+        assert np.allclose(liq.box.lengths, [mock_job_gemc["box_L_liq"]] * 3)
+
+    def test_lattice_no_overlaps(self):
+        rng = np.random.default_rng(0)
+        water = np.array([[0, 0, 0], [0.1, 0, 0], [-0.033, 0.094, 0]])
+        xyz = system_builder._lattice_xyz(water, 2000, 3.9, rng)
+        assert np.all((xyz >= 0) & (xyz < 3.9))
+        molecules = xyz.reshape(2000, 3, 3)
+        bonds = molecules[:, 1] - molecules[:, 0]
+        bonds -= 3.9 * np.round(bonds / 3.9)
+        assert np.allclose(np.linalg.norm(bonds, axis=1), 0.1)
+        overlapping = system_builder._overlapping_molecules(
+            molecules, 3.9, 0.2, np.arange(2000)
+        )
+        assert len(overlapping) == 0
+
+    def test_invalid_packing(self, mock_job_npt):
+        with pytest.raises(ValueError):
+            construct_system(mock_job_npt, packing="random")
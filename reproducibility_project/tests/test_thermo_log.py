@@ -0,0 +1,110 @@
+import os
+
+import gsd.hoomd
+import numpy as np
+import pytest
+
+from reproducibility_project.src.analysis.thermo_log import (
+    read_gsd_log,
+    read_log_column,
+)
+from reproducibility_project.tests.base_test import BaseTest
+
+
+def write_log(filename, data, mode="w", header=True):
+    with open(filename, mode) as f:
+        if header:
+            f.write("timestep potential_energy pressure\n")
+        for row in data:
+            f.write(" ".join(str(value) for value in row) + "\n")
+
+
+def write_gsd_log(filename, data):
+    with gsd.hoomd.open(name=filename, mode="w") as f:
+        for row in data:
+            s = gsd.hoomd.Snapshot()
+            s.configuration.step = int(row[0])
+            s.log["md/compute/ThermodynamicQuantities/potential_energy"] = [
+                row[1]
+            ]
+            s.log["md/compute/ThermodynamicQuantities/pressure"] = [row[2]]
+            f.append(s)
+
+
+class TestThermoLog(BaseTest):
+    @pytest.fixture
+    def data(self):
+        rng = np.random.default_rng(432)
+        data = rng.normal(size=(100, 3))
+        data[:, 0] = np.arange(100) * 5000
+        return data
+
+    def test_matches_genfromtxt(self, tmp_job, data):
+        write_log(tmp_job.fn("log.txt"), data)
+        expected = np.genfromtxt(tmp_job.fn("log.txt"), names=True)
+        for name in expected.dtype.names:
+            column = read_log_column(tmp_job, name)
+            assert isinstance(column, np.memmap)
+            assert np.array_equal(column, expected[name])
+        assert os.path.isfile(
+            tmp_job.fn(os.path.join("log.txt.columns", "pressure.npy"))
+        )
+
+    def test_appended_log(self, tmp_job, data):
+        write_log(tmp_job.fn("log.txt"), data[:40])
+        assert len(read_log_column(tmp_job, "pressure")) == 40
+        # A restarted run appends a repeated header and more rows.
+        write_log(tmp_job.fn("log.txt"), data[40:], mode="a")
+        assert np.array_equal(read_log_column(tmp_job, "pressure"), data[:, 2])
+        assert np.array_equal(
+            read_log_column(tmp_job, "potential_energy"), data[:, 1]
+        )
+
+    def test_rewritten_log(self, tmp_job, data):
+        write_log(tmp_job.fn("log.txt"), data)
+        read_log_column(tmp_job, "pressure")
+        write_log(tmp_job.fn("log.txt"), data[:10])
+        assert np.array_equal(
+            read_log_column(tmp_job, "pressure"), data[:10, 2]
+        )
+
+    def test_rewritten_longer_log(self, tmp_job, data):
+        write_log(tmp_job.fn("log.txt"), data[:40])
+        read_log_column(tmp_job, "pressure")
+        # A run restarted from scratch that has grown past the cached rows.
+        write_log(tmp_job.fn("log.txt"), data[50:])
+        assert np.array_equal(
+            read_log_column(tmp_job, "pressure"), data[50:, 2]
+        )
+
+    def test_append_in_place(self, tmp_job, data):
+        write_log(tmp_job.fn("log.txt"), data[:40])
+        read_log_column(tmp_job, "pressure")
+        fn = tmp_job.fn(os.path.join("log.txt.columns", "pressure.npy"))
+        inode = os.stat(fn).st_ino
+        write_log(tmp_job.fn("log.txt"), data[40:], mode="a", header=False)
+        column = read_log_column(tmp_job, "pressure")
+        assert os.stat(fn).st_ino == inode
+        assert np.array_equal(column, data[:, 2])
+        assert np.array_equal(np.load(fn), data[:, 2])
+
+    def test_missing_variable(self, tmp_job, data):
+        write_log(tmp_job.fn("log.txt"), data)
+        with pytest.raises(ValueError, match=r"Variable volume not found"):
+            read_log_column(tmp_job, "volume")
+
+    def test_gsd_log(self, tmp_job, data):
+        write_gsd_log(tmp_job.fn("log.gsd"), data)
+        columns = read_gsd_log(tmp_job.fn("log.gsd"))
+        assert sorted(columns) == ["potential_energy", "pressure", "timestep"]
+        for i, name in enumerate(["timestep", "potential_energy", "pressure"]):
+            assert np.array_equal(columns[name], data[:, i])
+        assert list(read_gsd_log(tmp_job.fn("log.gsd"), ["pressure"])) == [
+            "pressure"
+        ]
+        assert np.array_equal(
+            read_log_column(tmp_job, "pressure", filename="log.gsd"),
+            data[:, 2],
+        )
+        with pytest.raises(ValueError, match=r"Variable volume not found"):
+            read_log_column(tmp_job, "volume", filename="log.gsd")
@@ -0,0 +1,151 @@
+import freud
+import gsd.hoomd
+import numpy as np
+import pytest
+
+from reproducibility_project.src.analysis.rdf import _trajectory_rdf
+from reproducibility_project.src.analysis.trajectory import (
+    count_frames,
+    iter_frames,
+    last_box,
+)
+from reproducibility_project.tests.base_test import BaseTest
+
+
+def write_xyz(filename, gsdfile):
+    """Write a gsd trajectory as a multi-frame xyz file in Angstrom."""
+    with gsd.hoomd.open(gsdfile) as trajectory, open(filename, "w") as f:
+        for frame in trajectory:
+            types = np.asarray(frame.particles.types)[frame.particles.typeid]
+            f.write(f"{frame.particles.N}\ncomment\n")
+            for name, xyz in zip(types, frame.particles.position * 10):
+                f.write(f"{name} {xyz[0]} {xyz[1]} {xyz[2]}\n")
+
+
+def write_xtc(filename, gsdfile):
+    """Write a gsd trajectory as an xtc file, returning the topology file."""
+    import mdtraj as md
+
+    with gsd.hoomd.open(gsdfile) as trajectory:
+        xyz = np.array([frame.particles.position for frame in trajectory])
+        boxes = np.array([frame.configuration.box[:3] for frame in trajectory])
+        types = np.asarray(trajectory[0].particles.types)
+        names = types[trajectory[0].particles.typeid]
+    top = md.Topology()
+    residue = top.add_residue("RES", top.add_chain())
+    for name in names:
+        top.add_atom(name, md.element.virtual, residue)
+    # Shift the origin from the box center to the corner, as in GROMACS.
+    traj = md.Trajectory(
+        xyz + boxes[:, None, :] / 2,
+        top,
+        unitcell_lengths=boxes,
+        unitcell_angles=np.full_like(boxes, 90.0),
+    )
+    traj.save_xtc(str(filename))
+    traj[0].save_gro(str(filename) + ".gro")
+    return str(filename) + ".gro"
+
+
+class TestTrajectory(BaseTest):
+    def test_gsd_frames(self, gsdfile_random):
+        frames = [
+            f for c in iter_frames(gsdfile_random, chunk_size=3) for f in c
+        ]
+        with gsd.hoomd.open(gsdfile_random) as trajectory:
+            assert (
+                len(frames) == len(trajectory) == count_frames(gsdfile_random)
+            )
+            for frame, snap in zip(frames, trajectory):
+                assert np.allclose(frame.positions, snap.particles.position)
+                assert np.allclose(frame.box, snap.configuration.box)
+                assert frame.bonds is None
+            assert np.allclose(
+                last_box(gsdfile_random), trajectory[-1].configuration.box
+            )
+
+    def test_chunks(self, gsdfile_random):
+        n_frames = count_frames(gsdfile_random)
+        chunks = list(iter_frames(gsdfile_random, stride=2, chunk_size=2))
+        assert all(len(chunk) <= 2 for chunk in chunks)
+        assert sum(len(chunk) for chunk in chunks) == len(range(0, n_frames, 2))
+
+    def test_gsd_bonds(self, gsdfile_bonds):
+        [[frame]] = iter_frames(gsdfile_bonds, start=-1)
+        with gsd.hoomd.open(gsdfile_bonds) as trajectory:
+            assert np.array_equal(frame.bonds, trajectory[-1].bonds.group)
+
+    def test_xyz_frames(self, gsdfile_random, tmp_path):
+        xyzfile = tmp_path / "box1movie1a.xyz.1000"
+        write_xyz(xyzfile, gsdfile_random)
+        box = last_box(gsdfile_random)
+        assert count_frames(xyzfile) == count_frames(gsdfile_random)
+        xyz = list(iter_frames(xyzfile, start=1, stride=3, box=box))
+        ref = list(iter_frames(gsdfile_random, start=1, stride=3))
+        assert len(xyz[0]) == len(ref[0])
+        for frame, ref_frame in zip(xyz[0], ref[0]):
+            assert np.allclose(frame.positions, ref_frame.positions, atol=1e-5)
+            assert np.array_equal(frame.types, ref_frame.types)
+
+    def test_xyz_rdf(self, gsdfile_random, tmp_path):
+        xyzfile = tmp_path / "traj.xyz"
+        write_xyz(xyzfile, gsdfile_random)
+        box = last_box(gsdfile_random)
+        ref = _trajectory_rdf(gsdfile_random, frames=5)
+        rdf = _trajectory_rdf(xyzfile, frames=5, box=box, n_workers=2)
+        assert np.allclose(rdf.rdf, ref.rdf, atol=1e-3)
+
+    def test_xtc_rdf(self, gsdfile_random, tmp_path):
+        pytest.importorskip("mdtraj")
+        xtcfile = tmp_path / "prod.xtc"
+        top = write_xtc(xtcfile, gsdfile_random)
+        assert count_frames(xtcfile, top) == count_frames(gsdfile_random)
+        assert np.allclose(
+            last_box(xtcfile, top), last_box(gsdfile_random), atol=1e-3
+        )
+        ref = _trajectory_rdf(gsdfile_random, frames=5, stride=2)
+        rdf = _trajectory_rdf(xtcfile, frames=5, stride=2, top=top)
+        # The xtc precision (1e-3 nm) moves a few pairs across bin edges.
+        assert np.allclose(rdf.rdf, ref.rdf, atol=0.1)
+
+    @pytest.mark.parametrize("kind", ["gsd", "xyz", "xtc"])
+    @pytest.mark.parametrize(
+        "start, stop, stride", [(-3, None, 1), (-5, -1, 2), (0, 0, 1)]
+    )
+    def test_slicing(self, gsdfile_random, tmp_path, kind, start, stop, stride):
+        kwargs = {}
+        if kind == "gsd":
+            filename = gsdfile_random
+        elif kind == "xyz":
+            filename = tmp_path / "traj.xyz"
+            write_xyz(filename, gsdfile_random)
+            kwargs["box"] = last_box(gsdfile_random)
+        else:
+            pytest.importorskip("mdtraj")
+            filename = tmp_path / "prod.xtc"
+            kwargs["top"] = write_xtc(filename, gsdfile_random)
+        frames = [
+            frame
+            for chunk in iter_frames(
+                filename, start=start, stop=stop, stride=stride, **kwargs
+            )
+            for frame in chunk
+        ]
+        with gsd.hoomd.open(gsdfile_random) as trajectory:
+            ref = list(trajectory)[start:stop:stride]
+        assert len(frames) == len(ref)
+        for frame, snap in zip(frames, ref):
+            # Up to a translation, the xtc origin is at the box corner.
+            box = freud.box.Box.from_box(snap.configuration.box)
+            shift = box.wrap(frame.positions - snap.particles.position)
+            assert np.allclose(box.wrap(shift - shift[0]), 0, atol=1e-2)
+
+    def test_xyz_requires_box(self, gsdfile_random, tmp_path):
+        xyzfile = tmp_path / "traj.xyz"
+        write_xyz(xyzfile, gsdfile_random)
+        with pytest.raises(ValueError):
+            next(iter_frames(xyzfile))
+
+    def test_unsupported_format(self, tmp_path):
+        with pytest.raises(ValueError):
+            next(iter_frames(tmp_path / "traj.dat"))
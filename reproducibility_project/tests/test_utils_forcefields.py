@@ -1,8 +1,18 @@
 """Test file to ensure that forcefield loading is behaving as expected."""
+import pickle
+
+import mbuild as mb
+import numpy as np
 import pytest
 from foyer import Forcefield
+from mbuild.lib.molecules.water import WaterSPC
 
-from reproducibility_project.src.utils.forcefields import load_ff
+from reproducibility_project.src.utils.forcefields import (
+    _load_ff,
+    _parameter_signature,
+    apply_ff,
+    load_ff,
+)
 from reproducibility_project.tests.base_test import BaseTest
 
 
@@ -21,3 +31,84 @@ class TestForcefields(BaseTest):
     def test_correct_ff_names(self, ff_name):
         ff = load_ff(name=ff_name)
         assert isinstance(ff, Forcefield)
+
+    def test_apply_ff_replicates(self, spceff):
+        system = mb.fill_box(WaterSPC(), n_compounds=10, box=[2, 2, 2])
+        reference = spceff.apply(system)
+        structure = apply_ff(spceff, system)
+        assert len(structure.atoms) == len(reference.atoms)
+        assert len(structure.bonds) == len(reference.bonds)
+        assert len(structure.angles) == len(reference.angles)
+        assert [a.type for a in structure.atoms] == [
+            a.type for a in reference.atoms
+        ]
+        assert [a.charge for a in structure.atoms] == [
+            a.charge for a in reference.atoms
+        ]
+        assert [b.type.req for b in structure.bonds] == [
+            b.type.req for b in reference.bonds
+        ]
+        assert np.allclose(structure.coordinates, reference.coordinates)
+        assert np.allclose(structure.box, reference.box)
+
+    def test_apply_ff_isomers(self, monkeypatch):
+        from reproducibility_project.src.utils import forcefields
+
+        def molecule(bonds):
+            compound = mb.Compound()
+            for i in range(3):
+                compound.add(mb.Compound(name="C", pos=[i * 0.15, 0, 0]))
+            for i, j in bonds:
+                compound.add_bond((compound[i], compound[j]))
+            return compound
+
+        # Same particle names, different bonds
+        system = mb.Compound()
+        system.add(molecule([(0, 1), (1, 2)]))
+        system.add(molecule([(0, 1), (0, 2)]))
+        system.box = mb.Box([2, 2, 2])
+
+        class Forcefield:
+            def apply(self, compound, **kwargs):
+                return compound
+
+        def fail(*args, **kwargs):
+            raise AssertionError("Replicated a different molecule.")
+
+        monkeypatch.setattr(forcefields, "_apply_cached", fail)
+        assert apply_ff(Forcefield(), system) is system
+
+    def test_load_ff_cached(self, tmp_path):
+        ff = load_ff(name="spce", cache_dir=str(tmp_path))
+        assert load_ff(name="spce", cache_dir=str(tmp_path)) is ff
+        assert len(list(tmp_path.glob("spce-*.pkl"))) == 1
+
+    def test_load_ff_disk_cache(self, tmp_path):
+        ff = load_ff(name="benzene-ua", cache_dir=str(tmp_path))
+        _load_ff.cache_clear()
+        from_disk = load_ff(name="benzene-ua", cache_dir=str(tmp_path))
+        assert from_disk is not ff
+        assert isinstance(from_disk, Forcefield)
+        assert set(from_disk.atomTypeDefinitions) == set(ff.atomTypeDefinitions)
+
+    def test_load_ff_corrupt_cache(self, tmp_path):
+        load_ff(name="spce", cache_dir=str(tmp_path))
+        [cache_file] = tmp_path.glob("spce-*.pkl")
+        cache_file.write_bytes(b"\x80\x04\x95")
+        _load_ff.cache_clear()
+        ff = load_ff(name="spce", cache_dir=str(tmp_path))
+        assert isinstance(ff, Forcefield)
+        with open(cache_file, "rb") as f:
+            assert isinstance(pickle.load(f), Forcefield)
+
+    def test_apply_ff_atomtyping_cache(self, tmp_path):
+        ff = load_ff(name="spce", cache_dir=None)
+        system = mb.fill_box(WaterSPC(), n_compounds=10, box=[2, 2, 2])
+        fresh = apply_ff(ff, system, cache_dir=str(tmp_path))
+        assert len(list(tmp_path.glob("*.pkl"))) == 1
+        cached = apply_ff(ff, system, cache_dir=str(tmp_path), verify=True)
+        assert _parameter_signature(cached) == _parameter_signature(fresh)
+        assert np.allclose(cached.coordinates, fresh.coordinates)
+        assert _parameter_signature(cached) == _parameter_signature(
+            ff.apply(system)
+        )